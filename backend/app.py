@@ -33,6 +33,19 @@ def create_app():
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
     app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16777216))  # 16MB
     app.config['USE_DATABASE'] = os.environ.get('USE_DATABASE', 'false').lower() == 'true'
+    app.config['JWT_CACHE_TTL'] = int(os.environ.get('JWT_CACHE_TTL', 60))  # seconds a verified token stays cached
+    app.config['BCRYPT_COST'] = int(os.environ.get('BCRYPT_COST', 12))  # tune with scripts/benchmark_bcrypt.py
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 30))  # seconds a fetched user row stays cached
+    app.config['SUPABASE_URL'] = os.environ.get('SUPABASE_URL')
+    app.config['SUPABASE_ANON_KEY'] = os.environ.get('SUPABASE_ANON_KEY')
+    
+    # Faster JSON parsing and serialization when orjson is installed
+    try:
+        from utils.json_provider import OrjsonProvider
+        app.json = OrjsonProvider(app)
+        print("⚡ Using orjson JSON provider")
+    except ImportError:
+        print("📄 orjson not installed - using standard JSON provider")
     
     # Environment detection
     is_production = os.environ.get('FLASK_ENV') == 'production'
@@ -465,7 +478,7 @@ def create_app():
             
             if os.path.exists(stats_file):
                 with open(stats_file, 'r') as f:
-                    stats = json.load(f)
+                    stats = app.json.loads(f.read())
                 return jsonify(stats)
             else:
                 # Return default stats
@@ -539,7 +552,7 @@ def create_app():
             # Load existing stats
             if os.path.exists(stats_file):
                 with open(stats_file, 'r') as f:
-                    stats = json.load(f)
+                    stats = app.json.loads(f.read())
             else:
                 stats = {
                     "totalSessions": 0,
@@ -597,7 +610,7 @@ def create_app():
             
             # Save updated stats
             with open(stats_file, 'w') as f:
-                json.dump(stats, f, indent=2)
+                f.write(app.json.dumps(stats))
             
             print(f"✅ Session saved to JSON: {stats['totalSessions']} total sessions")
             return jsonify({'success': True, 'message': 'Session saved successfully'})
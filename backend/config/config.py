@@ -6,6 +6,9 @@ class Config:
     SUPABASE_ANON_KEY = os.environ.get('SUPABASE_ANON_KEY', '')
     USE_DATABASE = os.environ.get('USE_DATABASE', 'true').lower() == 'true'
     PORT = int(os.environ.get('PORT', 8000))
+    JWT_CACHE_TTL = int(os.environ.get('JWT_CACHE_TTL', 60))  # seconds a verified token stays cached
+    BCRYPT_COST = int(os.environ.get('BCRYPT_COST', 12))  # tune with scripts/benchmark_bcrypt.py
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))  # seconds a fetched user row stays cached
     DEBUG = False
 
 class DevelopmentConfig(Config):
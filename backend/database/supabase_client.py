@@ -1,7 +1,9 @@
 # backend/database/supabase_client.py
 import os
+import atexit
 import logging
 from typing import Optional, Dict, Any
+import httpx
 from supabase import create_client, Client
 
 logger = logging.getLogger(__name__)
@@ -11,6 +13,11 @@ class SupabaseManager:
     _instance: Optional[Client] = None
     _initialized = False
     
+    # Connection pool shared by every PostgREST call in the process
+    HTTP_MAX_CONNECTIONS = 20
+    HTTP_MAX_KEEPALIVE = 10
+    HTTP_TIMEOUT = 10.0
+    
     @classmethod
     def get_client(cls) -> Client:
         """Get Supabase client instance"""
@@ -38,6 +45,7 @@ class SupabaseManager:
             
             # Create client
             cls._instance = create_client(supabase_url, supabase_key)
+            cls._configure_pool(cls._instance)
             cls._initialized = True
             
             logger.info(f"Supabase client initialized successfully for: {supabase_url}")
@@ -46,6 +54,35 @@ class SupabaseManager:
             logger.error(f"Failed to initialize Supabase client: {e}")
             raise
     
+    @classmethod
+    def _configure_pool(cls, client: Client):
+        """Swap the PostgREST session for a pooled keep-alive client"""
+        session = client.postgrest.session
+        client.postgrest.session = httpx.Client(
+            base_url=session.base_url,
+            headers=session.headers,
+            limits=httpx.Limits(
+                max_connections=cls.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=cls.HTTP_MAX_KEEPALIVE
+            ),
+            timeout=httpx.Timeout(cls.HTTP_TIMEOUT)
+        )
+        session.close()
+        
+        logger.info(
+            f"Supabase HTTP pool configured: {cls.HTTP_MAX_CONNECTIONS} connections, "
+            f"{cls.HTTP_MAX_KEEPALIVE} keep-alive, {cls.HTTP_TIMEOUT}s timeout"
+        )
+    
+    @classmethod
+    def close(cls):
+        """Close pooled connections held by the client"""
+        if cls._instance is not None:
+            try:
+                cls._instance.postgrest.session.close()
+            except Exception as e:
+                logger.warning(f"Error closing Supabase HTTP pool: {e}")
+    
     @classmethod
     def test_connection(cls) -> Dict[str, Any]:
         """Test the Supabase connection"""
@@ -74,9 +111,12 @@ class SupabaseManager:
     @classmethod
     def reset_client(cls):
         """Reset client instance (useful for testing)"""
+        cls.close()
         cls._instance = None
         cls._initialized = False
 
+atexit.register(SupabaseManager.close)
+
 def get_supabase() -> Client:
     """Get Supabase client instance - main entry point"""
     return SupabaseManager.get_client()
@@ -1,10 +1,17 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app
 import asyncio
+import json
 import sys
 import os
 import uuid
 from datetime import datetime
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Add the backend directory to the path if not already there
 backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if backend_dir not in sys.path:
@@ -75,6 +82,30 @@ except ImportError:
 
 analytics_bp = Blueprint('analytics', __name__)
 
+# Performance trend entries encoded per streamed chunk
+TREND_CHUNK_SIZE = 256
+
+def _json_bytes(obj) -> bytes:
+    """Encode one response fragment"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, default=str).encode('utf-8')
+
+def _stream_detailed_analytics(result):
+    """Yield the detailed analytics payload section by section, trends in chunks"""
+    data = result['data']
+    yield b'{"success":' + _json_bytes(result['success']) + b',"data":{'
+    for key in ('userStats', 'sessions', 'recommendations'):
+        yield _json_bytes(key) + b':' + _json_bytes(data[key]) + b','
+    
+    yield b'"performanceTrends":['
+    trends = data['performanceTrends']
+    for start in range(0, len(trends), TREND_CHUNK_SIZE):
+        chunk = b','.join(_json_bytes(trend) for trend in trends[start:start + TREND_CHUNK_SIZE])
+        yield (b',' if start else b'') + chunk
+    
+    yield b'],"timeRange":' + _json_bytes(data['timeRange']) + b'}}'
+
 def get_analytics_service():
     """Get analytics service instance"""
     if not ANALYTICS_AVAILABLE:
@@ -145,16 +176,10 @@ def get_sessions(user_id='anonymous'):
     page = max(int(request.args.get('page', 1)), 1)
     
     analytics_service = get_analytics_service()
-    sessions = analytics_service._load_sessions()
+    total = len(analytics_service._load_sessions(user_id))
     
-    # Filter by user
-    user_sessions = [s for s in sessions if s.get('userId') == user_id]
-    user_sessions.sort(key=lambda x: x.get('completedAt', ''), reverse=True)
-    
-    # Paginate
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    paginated_sessions = user_sessions[start_idx:end_idx]
+    # Paginate newest first
+    paginated_sessions = analytics_service._recent_sessions(user_id, limit, offset=(page - 1) * limit)
     
     return jsonify({
         'success': True,
@@ -162,8 +187,8 @@ def get_sessions(user_id='anonymous'):
         'pagination': {
             'page': page,
             'limit': limit,
-            'total': len(user_sessions),
-            'pages': (len(user_sessions) + limit - 1) // limit
+            'total': total,
+            'pages': (total + limit - 1) // limit
         }
     })
 
@@ -188,7 +213,8 @@ def get_detailed_analytics(user_id='anonymous'):
     analytics_service = get_analytics_service()
     result = asyncio.run(analytics_service.get_detailed_analytics(user_id, time_range))
     
-    return jsonify(result)
+    # Trends span every session in the range, so send them without building one large body
+    return Response(_stream_detailed_analytics(result), mimetype='application/json')
 
 @analytics_bp.route('/stats/<user_id>', methods=['GET'])
 @analytics_bp.route('/stats', methods=['GET'])
@@ -223,9 +249,9 @@ def get_user_stats(user_id='anonymous'):
             })
     
     analytics_service = get_analytics_service()
-    users = analytics_service._load_user_stats()
+    user_stats = analytics_service._get_user(user_id)
     
-    if user_id not in users:
+    if user_stats is None:
         return jsonify({
             'success': True,
             'stats': {
@@ -240,15 +266,11 @@ def get_user_stats(user_id='anonymous'):
             }
         })
     
-    user_stats = users[user_id]
-    
     # Get recent sessions for display
-    sessions = analytics_service._load_sessions()
-    recent_sessions = [s for s in sessions if s.get('userId') == user_id]
-    recent_sessions.sort(key=lambda x: x.get('completedAt', ''), reverse=True)
+    recent_sessions = analytics_service._recent_sessions(user_id, 5)
     
     formatted_sessions = []
-    for session in recent_sessions[:5]:
+    for session in recent_sessions:
         duration = session.get('duration', 0)
         formatted_sessions.append({
             'date': session.get('completedAt', '')[:10],
@@ -281,9 +303,7 @@ def get_goals(user_id='anonymous'):
         return jsonify({'success': True, 'goals': []})
     
     analytics_service = get_analytics_service()
-    goals_data = analytics_service._load_goals()
-    
-    user_goals = goals_data.get(user_id, [])
+    user_goals = analytics_service._load_goals(user_id)
     active_goals = [goal for goal in user_goals if goal.get('status') == 'active']
     
     return jsonify({'success': True, 'goals': active_goals})
@@ -302,10 +322,7 @@ def create_goal():
     user_id = data.get('userId', 'anonymous')
     
     analytics_service = get_analytics_service()
-    goals_data = analytics_service._load_goals()
-    
-    if user_id not in goals_data:
-        goals_data[user_id] = []
+    user_goals = analytics_service._load_goals(user_id)
     
     new_goal = {
         'id': str(uuid.uuid4()),
@@ -321,8 +338,8 @@ def create_goal():
         'updatedAt': datetime.now().isoformat()
     }
     
-    goals_data[user_id].append(new_goal)
-    analytics_service._save_goals(goals_data)
+    user_goals.append(new_goal)
+    analytics_service._save_goals(user_id, user_goals)
     
     return jsonify({
         'success': True,
@@ -339,13 +356,12 @@ def get_achievements(user_id='anonymous'):
         return jsonify({'success': True, 'achievements': []})
     
     analytics_service = get_analytics_service()
-    users = analytics_service._load_user_stats()
+    user_stats = analytics_service._get_user(user_id)
     
-    if user_id not in users:
+    if user_stats is None:
         return jsonify({'success': True, 'achievements': []})
     
-    achievements = users[user_id].get('achievements', [])
-    achievements.sort(key=lambda x: x.get('earnedAt', ''), reverse=True)
+    achievements = sorted(user_stats.get('achievements', []), key=lambda x: x.get('earnedAt', ''), reverse=True)
     
     return jsonify({'success': True, 'achievements': achievements})
 
@@ -388,21 +404,13 @@ def reset_user_data(user_id='anonymous'):
     analytics_service = get_analytics_service()
     
     # Remove user from stats
-    users = analytics_service._load_user_stats()
-    if user_id in users:
-        del users[user_id]
-        analytics_service._save_user_stats(users)
+    analytics_service._delete_user(user_id)
     
     # Remove user sessions
-    sessions = analytics_service._load_sessions()
-    sessions = [s for s in sessions if s.get('userId') != user_id]
-    analytics_service._save_sessions(sessions)
+    analytics_service._delete_sessions(user_id)
     
     # Remove user goals
-    goals_data = analytics_service._load_goals()
-    if user_id in goals_data:
-        del goals_data[user_id]
-        analytics_service._save_goals(goals_data)
+    analytics_service._delete_goals(user_id)
     
     return jsonify({
         'success': True,
@@ -7,6 +7,12 @@ logger = logging.getLogger(__name__)
 
 auth_bp = Blueprint('auth', __name__)
 
+@auth_bp.record_once
+def init_auth(state):
+    """Build the auth service when the blueprint is registered, not on first request"""
+    from services.auth_service_fallback import init_auth_service_with_fallback
+    init_auth_service_with_fallback(state.app)
+
 def get_auth_service():
     """Import auth service to avoid circular imports"""
     from services.auth_service import get_auth_service
@@ -258,18 +264,17 @@ def change_password():
         
         # Update password in database
         if auth_service.supabase_url and auth_service.supabase_key:
-            import requests
-            
             update_data = {'password_hash': new_password_hash}
             
-            response = requests.patch(
-                f"{auth_service.supabase_url}/rest/v1/users?id=eq.{user_id}",
-                headers=auth_service.headers,
+            response = auth_service.session.patch(
+                f"{auth_service.supabase_url}/rest/v1/users",
+                params={'id': f'eq.{user_id}', 'select': 'id'},
                 json=update_data,
                 timeout=10
             )
             
             if response.status_code in [200, 204]:
+                auth_service.invalidate_user(user_id)
                 return jsonify({
                     'success': True,
                     'message': 'Password changed successfully'
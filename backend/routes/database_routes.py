@@ -126,7 +126,6 @@ def save_database_stats():
             'success': True,
             'message': 'Session saved to database',
             'session_id': result.get('session_id'),
-            'new_achievements': result.get('new_achievements', []),
             'source': 'database'
         })
         
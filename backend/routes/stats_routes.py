@@ -1,6 +1,13 @@
-from flask import Blueprint, request, jsonify, current_app
+import json
+import logging
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 from services.stats_service import StatsService
-from utils.validators import validate_stats_data, create_validation_report
+from utils.validators import validate_stats_data, fast_validate_stats_data, create_validation_report
 from utils.decorators import handle_errors, rate_limit
 
 stats_bp = Blueprint('stats', __name__)
@@ -23,25 +30,36 @@ def get_stats():
 @handle_errors
 def save_stats():
     """Save typing session statistics with enhanced validation and debugging"""
-    data = request.get_json()
-    
-    # Enhanced validation with detailed reporting
-    validation_result = validate_stats_data(data)
+    # Typed fast path: well-formed payloads are parsed and checked in C.
+    # Rejections and debug requests go through the detailed validator.
+    data = fast_validate_stats_data(request.get_data())
+    if data is not None and not current_app.debug:
+        validation_result = {'valid': True, 'errors': [], 'warnings': []}
+    else:
+        data = request.get_json()
+        
+        # Enhanced validation with detailed reporting
+        validation_result = validate_stats_data(data)
     
     # Log validation details for debugging
-    current_app.logger.info(f"Stats validation result: {validation_result}")
+    if current_app.logger.isEnabledFor(logging.INFO):
+        current_app.logger.info("Stats validation result: %s", validation_result)
     
     if not validation_result['valid']:
-        # Create detailed validation report for debugging
-        validation_report = create_validation_report(data)
-        current_app.logger.error(f"Validation failed:\n{validation_report}")
+        # Detailed validation report is only built in debug mode
+        validation_report = None
+        if current_app.debug:
+            validation_report = create_validation_report(data)
+            current_app.logger.error("Validation failed:\n%s", validation_report)
+        else:
+            current_app.logger.error("Validation failed: %s", validation_result['errors'])
         
         return jsonify({
             'error': 'Validation failed',
             'message': 'Invalid statistics data provided',
             'details': validation_result['errors'],
             'warnings': validation_result.get('warnings', []),
-            'validation_report': validation_report if current_app.debug else None
+            'validation_report': validation_report
         }), 400
     
     # Log warnings even if validation passes
@@ -103,22 +121,8 @@ def debug_stats():
     stats_service = get_stats_service()
     debug_info = stats_service.get_debug_info()
     
-    # Add current stats
-    try:
-        current_stats = stats_service.get_stats()
-        debug_info['current_stats'] = current_stats
-        debug_info['stats_valid'] = True
-        
-        # Analyze recent sessions for common issues
-        recent_sessions = current_stats.get('recentSessions', [])
-        debug_info['recent_sessions_analysis'] = analyze_recent_sessions(recent_sessions)
-        
-    except Exception as e:
-        debug_info['stats_valid'] = False
-        debug_info['stats_error'] = str(e)
-    
     # Add system information
-    debug_info['system_info'] = {
+    system_info = {
         'flask_debug': current_app.debug,
         'stats_file_config': current_app.config.get('STATS_FILE', 'Not configured'),
         'app_name': current_app.name,
@@ -130,7 +134,33 @@ def debug_stats():
         }
     }
     
-    return jsonify(debug_info)
+    def generate():
+        # Stream one section at a time instead of building the whole body
+        yield b'{'
+        for key, value in debug_info.items():
+            yield _json_bytes(key) + b':' + _json_bytes(value) + b','
+        
+        # Add current stats
+        try:
+            current_stats = stats_service.get_stats()
+            yield b'"current_stats":' + _json_bytes(current_stats) + b','
+            
+            # Analyze recent sessions for common issues
+            analysis = analyze_recent_sessions(current_stats.get('recentSessions', []))
+            yield b'"stats_valid":true,"recent_sessions_analysis":' + _json_bytes(analysis) + b','
+            
+        except Exception as e:
+            yield b'"stats_valid":false,"stats_error":' + _json_bytes(str(e)) + b','
+        
+        yield b'"system_info":' + _json_bytes(system_info) + b'}\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+def _json_bytes(obj) -> bytes:
+    """Serialize obj to JSON bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=str).encode('utf-8')
 
 @stats_bp.route('/validate-session', methods=['POST'])
 @handle_errors
@@ -153,13 +183,8 @@ def validate_session():
         'recommendations': get_validation_recommendations(validation_result, data)
     })
 
-@stats_bp.route('/test-duration-formatting', methods=['GET'])
-@handle_errors
-def test_duration_formatting():
-    """Test endpoint for duration formatting (development only)"""
-    if not current_app.debug:
-        return jsonify({'error': 'Only available in debug mode'}), 403
-    
+def _build_duration_test_results():
+    """Run the duration formatting cases once; the inputs never change"""
     test_durations = [0, 0.5, 1, 30, 60, 90, 180.7, 3661, -5, float('nan')]
     results = []
     
@@ -190,62 +215,71 @@ def test_duration_formatting():
                 'is_problem': True
             })
     
-    return jsonify({
+    return {
         'test_results': results,
         'summary': {
             'total_tests': len(results),
             'problematic_cases': len([r for r in results if r.get('is_problem', False)])
         }
-    })
+    }
+
+_DURATION_TEST_RESULTS = _build_duration_test_results()
+
+@stats_bp.route('/test-duration-formatting', methods=['GET'])
+@handle_errors
+def test_duration_formatting():
+    """Test endpoint for duration formatting (development only)"""
+    if not current_app.debug:
+        return jsonify({'error': 'Only available in debug mode'}), 403
+    
+    return jsonify(_DURATION_TEST_RESULTS)
+
+# Fields every recent session entry is expected to carry
+_REQUIRED_SESSION_FIELDS = frozenset(['date', 'duration', 'wpm', 'accuracy', 'mode'])
 
 def analyze_recent_sessions(recent_sessions):
     """Analyze recent sessions for common issues"""
-    analysis = {
-        'total_sessions': len(recent_sessions),
-        'zero_duration_count': 0,
-        'zero_wpm_count': 0,
-        'zero_accuracy_count': 0,
-        'missing_fields': [],
-        'unusual_patterns': []
-    }
+    total = len(recent_sessions)
+    
+    # Zero-value counts as C-level sums over the list
+    zero_duration = sum(s.get('duration') == '0m 0s' for s in recent_sessions)
+    zero_wpm = sum(s.get('wpm', 0) == 0 for s in recent_sessions)
+    zero_accuracy = sum(s.get('accuracy', 0) == 0 for s in recent_sessions)
+    
+    missing = set()
+    unusual = []
     
     for session in recent_sessions:
-        # Check for zero duration (the main issue)
-        if session.get('duration') == '0m 0s':
-            analysis['zero_duration_count'] += 1
-        
-        # Check for zero WPM
-        if session.get('wpm', 0) == 0:
-            analysis['zero_wpm_count'] += 1
-        
-        # Check for zero accuracy
-        if session.get('accuracy', 0) == 0:
-            analysis['zero_accuracy_count'] += 1
+        wpm = session.get('wpm', 0)
         
         # Check for missing fields
-        required_fields = ['date', 'duration', 'wpm', 'accuracy', 'mode']
-        for field in required_fields:
-            if field not in session:
-                if field not in analysis['missing_fields']:
-                    analysis['missing_fields'].append(field)
+        missing.update(_REQUIRED_SESSION_FIELDS - session.keys())
         
         # Check for unusual patterns
-        if session.get('wpm', 0) > 200:
-            analysis['unusual_patterns'].append(f"Very high WPM: {session.get('wpm')}")
+        if wpm > 200:
+            unusual.append(f"Very high WPM: {wpm}")
         
-        if session.get('accuracy', 0) == 100 and session.get('wpm', 0) > 100:
-            analysis['unusual_patterns'].append("Perfect accuracy with very high WPM (suspicious)")
+        if wpm > 100 and session.get('accuracy', 0) == 100:
+            unusual.append("Perfect accuracy with very high WPM (suspicious)")
     
-    # Add problem indicators
-    analysis['has_duration_issues'] = analysis['zero_duration_count'] > 0
-    analysis['has_wpm_issues'] = analysis['zero_wpm_count'] > 0
-    analysis['has_accuracy_issues'] = analysis['zero_accuracy_count'] > 0
+    analysis = {
+        'total_sessions': total,
+        'zero_duration_count': zero_duration,
+        'zero_wpm_count': zero_wpm,
+        'zero_accuracy_count': zero_accuracy,
+        'missing_fields': sorted(missing),
+        'unusual_patterns': unusual,
+        # Add problem indicators
+        'has_duration_issues': zero_duration > 0,
+        'has_wpm_issues': zero_wpm > 0,
+        'has_accuracy_issues': zero_accuracy > 0
+    }
     
     # Calculate percentages
-    if analysis['total_sessions'] > 0:
-        analysis['duration_issue_percentage'] = (analysis['zero_duration_count'] / analysis['total_sessions']) * 100
-        analysis['wpm_issue_percentage'] = (analysis['zero_wmp_count'] / analysis['total_sessions']) * 100
-        analysis['accuracy_issue_percentage'] = (analysis['zero_accuracy_count'] / analysis['total_sessions']) * 100
+    if total > 0:
+        analysis['duration_issue_percentage'] = (zero_duration / total) * 100
+        analysis['wpm_issue_percentage'] = (zero_wpm / total) * 100
+        analysis['accuracy_issue_percentage'] = (zero_accuracy / total) * 100
     
     return analysis
 
@@ -1,23 +1,119 @@
 # backend/services/auth_service.py - MINIMAL VERSION that matches your table
 import jwt
 import bcrypt
+import json
+import os
+import atexit
+import hmac
+import hashlib
+import secrets
 import uuid
 import re
+import string
+import time
+import threading
 import requests
-from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from typing import Dict, Optional, Union
 from flask import current_app
+from utils.cache import TTLCache
 import logging
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# Compiled once at import; validate_email/validate_password sit on the login path
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+_UPPER_CHARS = frozenset(string.ascii_uppercase)
+_LOWER_CHARS = frozenset(string.ascii_lowercase)
+_DIGIT_CHARS = frozenset(string.digits)
+# All strength rules in one pass; the per-class checks only run to explain a rejection
+_PASSWORD_RE = re.compile(r'(?=.*[A-Z])(?=.*[a-z])(?=.*[0-9]).{8,}', re.DOTALL)
+
+def _json_dumps(obj) -> bytes:
+    """Encode a Supabase request body"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+def _json_loads(data: bytes):
+    """Decode a Supabase response body"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Columns the auth code actually reads from the users table
+_USER_COLUMNS = 'id,email,password_hash,display_name,username,is_active,preferences,created_at,last_login'
+
+# bcrypt releases the GIL, so one worker per core runs hashes truly in parallel
+_BCRYPT_POOL = ThreadPoolExecutor(
+    max_workers=os.cpu_count() or 2,
+    thread_name_prefix='bcrypt'
+)
+
+# Recent bcrypt verification results for login retries. Keys use an HMAC
+# with a per-process secret so plaintext-derived digests never sit in memory
+# in a form that can be checked offline.
+_VERIFY_CACHE = TTLCache(maxsize=512, ttl=60)
+_VERIFY_CACHE_KEY = secrets.token_bytes(32)
+
+def _bcrypt_hash(password: bytes, rounds: int) -> str:
+    """Hash password bytes on a bcrypt pool worker"""
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+def _bcrypt_check(password: bytes, hashed: bytes) -> bool:
+    """Check password bytes against a hash on a bcrypt pool worker"""
+    return bcrypt.checkpw(password, hashed)
+
 class AuthService:
     """Minimal JWT Authentication service that matches your existing table structure"""
     
-    def __init__(self, secret_key: str, supabase_url: str = None, supabase_key: str = None):
+    # Seconds between background flushes of queued last_login updates
+    LAST_LOGIN_FLUSH_INTERVAL = 2.0
+    
+    # last_login is written at most once per user in this many seconds
+    LAST_LOGIN_MIN_INTERVAL = 300
+    
+    # Max decoded tokens kept in memory
+    TOKEN_CACHE_SIZE = 4096
+    
+    # Max user rows kept in memory
+    USER_CACHE_SIZE = 1024
+    
+    # (epoch second, ISO string) of the last formatted UTC timestamp
+    _LAST_ISO = (0, '')
+    
+    def __init__(self, secret_key: str, supabase_url: str = None, supabase_key: str = None,
+                 jwt_cache_ttl: int = 60, bcrypt_cost: int = 12, user_cache_ttl: int = 30):
         self.secret_key = secret_key
         self.supabase_url = supabase_url
         self.supabase_key = supabase_key
+        self.jwt_cache_ttl = jwt_cache_ttl
+        self.bcrypt_cost = bcrypt_cost
+        
+        # last_login writes are queued and flushed in bulk off the login path
+        self._pending_logins = deque()
+        self._login_flusher = None
+        self._login_flusher_lock = threading.Lock()
+        self._recent_logins = TTLCache(maxsize=10000, ttl=self.LAST_LOGIN_MIN_INTERVAL)
+        
+        # Decoded JWT payloads keyed by SHA-256(token), so repeat requests skip the HMAC check
+        self._token_cache = TTLCache(maxsize=self.TOKEN_CACHE_SIZE, ttl=jwt_cache_ttl)
+        
+        # Recently fetched user rows keyed by ('id', id) and ('email', email)
+        self._user_cache = TTLCache(maxsize=self.USER_CACHE_SIZE, ttl=user_cache_ttl)
+        
+        # Hash at the configured cost, checked against when no real hash exists.
+        # Computed in the background so startup isn't delayed.
+        self._dummy_hash = _BCRYPT_POOL.submit(_bcrypt_hash, secrets.token_bytes(16), bcrypt_cost)
         
         if self.supabase_url and self.supabase_key:
             self.headers = {
@@ -26,13 +122,35 @@ class AuthService:
                 'Content-Type': 'application/json',
                 'Prefer': 'return=representation'
             }
+            
+            # Pooled keep-alive session so logins don't pay a fresh TLS handshake
+            self.session = requests.Session()
+            self.session.headers.update(self.headers)
+            # Retry transient connection failures; urllib3 only retries idempotent methods by default
+            adapter = HTTPAdapter(
+                pool_connections=10,
+                pool_maxsize=20,
+                max_retries=Retry(total=2, backoff_factor=0.1)
+            )
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+    
+    @classmethod
+    def _utc_iso_now(cls) -> str:
+        """Current UTC time as ISO string, formatted at most once per second"""
+        now = int(time.time())
+        last_second, last_iso = cls._LAST_ISO
+        if now == last_second:
+            return last_iso
+        
+        iso = datetime.utcfromtimestamp(now).isoformat()
+        cls._LAST_ISO = (now, iso)
+        return iso
     
     def hash_password(self, password: str) -> str:
         """Hash password with bcrypt"""
         try:
-            salt = bcrypt.gensalt()
-            hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-            return hashed.decode('utf-8')
+            return _BCRYPT_POOL.submit(_bcrypt_hash, password.encode('utf-8'), self.bcrypt_cost).result()
         except Exception as e:
             logger.error(f"Error hashing password: {e}")
             raise ValueError("Failed to hash password")
@@ -40,7 +158,15 @@ class AuthService:
     def verify_password(self, password: str, hashed: str) -> bool:
         """Verify password against hash"""
         try:
-            return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+            password_bytes = password.encode('utf-8')
+            cache_key = (hmac.new(_VERIFY_CACHE_KEY, password_bytes, hashlib.sha256).digest(), hashed)
+            
+            result = _VERIFY_CACHE.get(cache_key)
+            if result is None:
+                result = _BCRYPT_POOL.submit(_bcrypt_check, password_bytes, hashed.encode('utf-8')).result()
+                _VERIFY_CACHE.set(cache_key, result)
+            
+            return result
         except Exception as e:
             logger.error(f"Error verifying password: {e}")
             return False
@@ -48,11 +174,12 @@ class AuthService:
     def generate_token(self, user_id: str, email: str, expires_in_days: int = 7) -> str:
         """Generate JWT token"""
         try:
+            now = int(time.time())
             payload = {
                 'user_id': user_id,
                 'email': email,
-                'iat': datetime.utcnow(),
-                'exp': datetime.utcnow() + timedelta(days=expires_in_days),
+                'iat': now,
+                'exp': now + expires_in_days * 86400,
                 'iss': 'typetutor-backend'
             }
             token = jwt.encode(payload, self.secret_key, algorithm='HS256')
@@ -67,11 +194,16 @@ class AuthService:
             if token.startswith('Bearer '):
                 token = token[7:]
             
-            payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
+            cache_key = hashlib.sha256(token.encode('utf-8')).digest()
+            payload = self._token_cache.get(cache_key)
+            if payload is not None:
+                return payload
             
-            if datetime.utcnow() > datetime.fromtimestamp(payload['exp']):
-                return None
+            payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
             
+            # Only successful decodes are cached, never past the token's own expiry
+            ttl = min(self.jwt_cache_ttl, payload['exp'] - time.time())
+            self._token_cache.set(cache_key, payload, ttl=ttl)
             return payload
             
         except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
@@ -82,20 +214,23 @@ class AuthService:
     
     def validate_email(self, email: str) -> bool:
         """Validate email format"""
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return re.match(pattern, email) is not None
+        return _EMAIL_RE.match(email) is not None
     
     def validate_password(self, password: str) -> Dict[str, Union[bool, list]]:
         """Validate password strength"""
+        if _PASSWORD_RE.fullmatch(password):
+            return {'valid': True, 'errors': []}
+        
         errors = []
+        chars = set(password)
         
         if len(password) < 8:
             errors.append("Password must be at least 8 characters long")
-        if not re.search(r'[A-Z]', password):
+        if _UPPER_CHARS.isdisjoint(chars):
             errors.append("Password must contain at least one uppercase letter")
-        if not re.search(r'[a-z]', password):
+        if _LOWER_CHARS.isdisjoint(chars):
             errors.append("Password must contain at least one lowercase letter")
-        if not re.search(r'\d', password):
+        if _DIGIT_CHARS.isdisjoint(chars):
             errors.append("Password must contain at least one number")
         
         return {'valid': len(errors) == 0, 'errors': errors}
@@ -103,6 +238,10 @@ class AuthService:
     def create_user(self, email: str, password: str, display_name: str = None) -> Dict:
         """Create user matching your exact table structure"""
         try:
+            # Normalize once; the local part keeps its original case for display
+            local_part = email.split('@', 1)[0]
+            email = email.lower()
+            
             # Validate input
             if not self.validate_email(email):
                 return {'success': False, 'error': 'Invalid email format'}
@@ -115,32 +254,27 @@ class AuthService:
                     'details': password_validation['errors']
                 }
             
-            # Check if user already exists
-            existing_user = self.get_user_by_email(email)
-            if existing_user:
-                return {'success': False, 'error': 'User with this email already exists'}
-            
             # Prepare user data to match your EXACT table structure
-            user_id = str(uuid.uuid4())
+            # Postgres accepts the undashed form and returns the canonical UUID
+            user_id = uuid.uuid4().hex
             password_hash = self.hash_password(password)
             
             # Your table has: id, username, email, created_at, updated_at, preferences, is_anonymous
             # After adding columns: display_name, is_active, password_hash, last_login
             user_data = {
                 'id': user_id,
-                'username': email.split('@')[0],  # Your table has this
-                'email': email.lower(),  # Your table has this (but was None in sample)
-                'display_name': display_name or email.split('@')[0],  # Adding this column
+                'username': local_part,  # Your table has this
+                'email': email,  # Your table has this (but was None in sample)
+                'display_name': display_name or local_part,  # Adding this column
                 'password_hash': password_hash,  # Adding this column
                 'is_active': True,  # Adding this column
                 'is_anonymous': False,  # Your table has this
                 'preferences': {},  # Your table has this
-                'created_at': datetime.utcnow().isoformat(),  # Your table has this
-                'updated_at': datetime.utcnow().isoformat(),  # Your table has this
+                # created_at/updated_at default to NOW() in the database
                 # last_login will be NULL initially (not included)
             }
             
-            logger.info(f"Creating user with data: {list(user_data.keys())}")
+            logger.info("Creating user with data: %s", list(user_data))
             
             if not self.supabase_url or not self.supabase_key:
                 return {
@@ -149,19 +283,25 @@ class AuthService:
                     'details': ['SUPABASE_URL and SUPABASE_ANON_KEY must be set']
                 }
             
-            # Insert into Supabase
-            response = requests.post(
+            # Insert into Supabase; the unique email constraint rejects duplicates
+            response = self.session.post(
                 f"{self.supabase_url}/rest/v1/users",
-                headers=self.headers,
-                json=user_data,
+                params={'select': _USER_COLUMNS},
+                data=_json_dumps(user_data),
                 timeout=10
             )
             
-            logger.info(f"Supabase response: {response.status_code}")
-            logger.info(f"Supabase response body: {response.text}")
+            logger.info("Supabase response: %s", response.status_code)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Supabase response body: %s", response.text)
+            
+            # Unique email constraint violation - the insert doubles as the existence check.
+            # Other conflicts (username, foreign keys) are reported as a failed creation below
+            if response.status_code == 409 and self._is_duplicate_email(response):
+                return {'success': False, 'error': 'User with this email already exists'}
             
             if response.status_code in [200, 201]:
-                result_data = response.json()
+                result_data = _json_loads(response.content)
                 if isinstance(result_data, list) and len(result_data) > 0:
                     user = result_data[0]
                 else:
@@ -184,12 +324,12 @@ class AuthService:
             else:
                 # Parse error details
                 try:
-                    error_json = response.json()
+                    error_json = _json_loads(response.content)
                     error_message = error_json.get('message', response.text)
                 except:
                     error_message = response.text
                 
-                logger.error(f"Supabase error: {error_message}")
+                logger.error("Supabase error: %s", error_message)
                 return {
                     'success': False,
                     'error': 'Failed to create user in database',
@@ -200,21 +340,33 @@ class AuthService:
             logger.error(f"Error in create_user: {e}")
             return {'success': False, 'error': 'Internal error during user creation'}
     
+    @staticmethod
+    def _is_duplicate_email(response) -> bool:
+        """Whether a PostgREST error is a unique violation on users.email"""
+        try:
+            error_json = _json_loads(response.content)
+        except Exception:
+            return False
+        if not isinstance(error_json, dict) or error_json.get('code') != '23505':
+            return False
+        # e.g. details "Key (email)=(a@b.com) already exists.", message naming users_email_key
+        return ('(email)' in (error_json.get('details') or '')
+                or 'users_email_key' in (error_json.get('message') or ''))
+    
     def authenticate_user(self, email: str, password: str) -> Dict:
         """Authenticate user with password hash"""
         try:
+            email = email.lower()
             if not self.validate_email(email):
                 return {'success': False, 'error': 'Invalid email format'}
             
             # Get user from database
-            user = self.get_user_by_email(email.lower())
-            if not user:
+            user = self.get_user_by_email(email)
+            if not user or not user.get('password_hash'):
+                # Spend a real bcrypt check so unknown accounts can't be told apart by latency
+                self.verify_password(password, self._dummy_hash.result())
                 return {'success': False, 'error': 'Invalid email or password'}
             
-            # Check if user has a password hash
-            if not user.get('password_hash'):
-                return {'success': False, 'error': 'Account not properly configured'}
-            
             # Verify password
             if not self.verify_password(password, user['password_hash']):
                 return {'success': False, 'error': 'Invalid email or password'}
@@ -250,18 +402,23 @@ class AuthService:
         if not self.supabase_url or not self.supabase_key:
             return None
         
+        email = email.lower()
+        cached = self._user_cache.get(('email', email))
+        if cached is not None:
+            return cached
+        
         try:
-            response = requests.get(
-                f"{self.supabase_url}/rest/v1/users?email=eq.{email.lower()}",
-                headers=self.headers,
+            response = self.session.get(
+                f"{self.supabase_url}/rest/v1/users",
+                params={'email': f'eq.{email}', 'select': _USER_COLUMNS},
                 timeout=10
             )
             
             if response.status_code == 200:
-                data = response.json()
-                return data[0] if data else None
+                data = _json_loads(response.content)
+                return self._cache_user(data[0]) if data else None
             else:
-                logger.error(f"Error fetching user: {response.status_code} - {response.text}")
+                logger.error("Error fetching user: %s - %s", response.status_code, response.text)
                 return None
                 
         except Exception as e:
@@ -273,45 +430,131 @@ class AuthService:
         if not self.supabase_url or not self.supabase_key:
             return None
         
+        cached = self._user_cache.get(('id', user_id))
+        if cached is not None:
+            return cached
+        
         try:
-            response = requests.get(
-                f"{self.supabase_url}/rest/v1/users?id=eq.{user_id}",
-                headers=self.headers,
+            response = self.session.get(
+                f"{self.supabase_url}/rest/v1/users",
+                params={'id': f'eq.{user_id}', 'select': _USER_COLUMNS},
                 timeout=10
             )
             
             if response.status_code == 200:
-                data = response.json()
-                return data[0] if data else None
+                data = _json_loads(response.content)
+                return self._cache_user(data[0]) if data else None
             else:
-                logger.error(f"Error fetching user by ID: {response.status_code} - {response.text}")
+                logger.error("Error fetching user by ID: %s - %s", response.status_code, response.text)
                 return None
                 
         except Exception as e:
             logger.error(f"Error getting user by ID: {e}")
             return None
     
+    def _cache_user(self, user: Dict) -> Dict:
+        """Cache a fetched user row under both its id and email"""
+        self._user_cache.set(('id', user['id']), user)
+        if user.get('email'):
+            self._user_cache.set(('email', user['email'].lower()), user)
+        return user
+    
+    def invalidate_user(self, user_id: str):
+        """Drop a user's cached row after it changes"""
+        cached = self._user_cache.get(('id', user_id))
+        self._user_cache.delete(('id', user_id))
+        if cached and cached.get('email'):
+            self._user_cache.delete(('email', cached['email'].lower()))
+    
     def update_last_login(self, user_id: str) -> bool:
-        """Update user's last login timestamp"""
+        """Queue a last_login update for the next background flush"""
+        if not self.supabase_url or not self.supabase_key:
+            return False
+        
+        # Debounce: a login stamp from the last few minutes is close enough
+        if self._recent_logins.get(user_id):
+            return True
+        self._recent_logins.set(user_id, True)
+        
+        self._pending_logins.append((user_id, self._utc_iso_now()))
+        self.invalidate_user(user_id)
+        self._start_login_flusher()
+        return True
+    
+    def flush_last_logins(self) -> bool:
+        """Write all queued last_login updates with a single bulk PATCH"""
         if not self.supabase_url or not self.supabase_key:
             return False
         
+        pending = {}
+        while True:
+            try:
+                user_id, timestamp = self._pending_logins.popleft()
+            except IndexError:
+                break
+            pending[user_id] = timestamp
+        
+        if not pending:
+            return True
+        
         try:
-            update_data = {'last_login': datetime.utcnow().isoformat()}
+            # Logins within one flush window share the newest timestamp
+            update_data = {'last_login': max(pending.values())}
             
-            response = requests.patch(
-                f"{self.supabase_url}/rest/v1/users?id=eq.{user_id}",
-                headers=self.headers,
-                json=update_data,
+            response = self.session.patch(
+                f"{self.supabase_url}/rest/v1/users",
+                params={'id': f"in.({','.join(pending)})", 'select': 'id'},
+                data=_json_dumps(update_data),
                 timeout=10
             )
             
-            return response.status_code in [200, 204]
+            if response.status_code not in [200, 204]:
+                logger.error("Error updating last login: %s - %s", response.status_code, response.text)
+                return False
+            return True
             
         except Exception as e:
             logger.error(f"Error updating last login: {e}")
             return False
     
+    def _start_login_flusher(self):
+        """Start the background last_login flusher on first use"""
+        if self._login_flusher is not None:
+            return
+        
+        with self._login_flusher_lock:
+            if self._login_flusher is None:
+                self._login_flusher = threading.Thread(
+                    target=self._login_flush_loop,
+                    name='last-login-flusher',
+                    daemon=True
+                )
+                self._login_flusher.start()
+                # Don't lose queued updates on a clean shutdown
+                atexit.register(self.flush_last_logins)
+    
+    def _login_flush_loop(self):
+        """Periodically flush queued last_login updates"""
+        while True:
+            time.sleep(self.LAST_LOGIN_FLUSH_INTERVAL)
+            self.flush_last_logins()
+    
+    def check_connection(self) -> bool:
+        """Check that the Supabase users table is reachable"""
+        if not self.supabase_url or not self.supabase_key:
+            return False
+        
+        try:
+            response = self.session.get(
+                f"{self.supabase_url}/rest/v1/users",
+                params={'select': 'id', 'limit': 1},
+                timeout=10
+            )
+            return response.status_code == 200
+        except Exception as e:
+            logger.error(f"Error checking Supabase connection: {e}")
+            return False
+    
     def refresh_token(self, token: str) -> Dict:
         """Refresh JWT token"""
         try:
@@ -354,17 +597,22 @@ class AuthService:
             logger.error(f"Error getting user profile: {e}")
             return {'success': False, 'error': 'Failed to get user profile'}
 
-# Global service instance
-_auth_service = None
+def init_auth_service(app) -> AuthService:
+    """Create the app's authentication service once, at startup"""
+    auth_service = AuthService(
+        app.config.get('SECRET_KEY', 'dev-secret-key'),
+        app.config.get('SUPABASE_URL'),
+        app.config.get('SUPABASE_ANON_KEY'),
+        jwt_cache_ttl=int(app.config.get('JWT_CACHE_TTL', 60)),
+        bcrypt_cost=int(app.config.get('BCRYPT_COST', 12)),
+        user_cache_ttl=int(app.config.get('USER_CACHE_TTL', 30))
+    )
+    app.extensions['auth_service'] = auth_service
+    return auth_service
 
 def get_auth_service() -> AuthService:
     """Get authentication service instance"""
-    global _auth_service
-    if _auth_service is None:
-        secret_key = current_app.config.get('SECRET_KEY', 'dev-secret-key')
-        supabase_url = current_app.config.get('SUPABASE_URL')
-        supabase_key = current_app.config.get('SUPABASE_ANON_KEY')
-        
-        _auth_service = AuthService(secret_key, supabase_url, supabase_key)
-    
-    return _auth_service
\ No newline at end of file
+    auth_service = current_app.extensions.get('auth_service')
+    if auth_service is None:
+        auth_service = init_auth_service(current_app._get_current_object())
+    return auth_service
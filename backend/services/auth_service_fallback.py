@@ -2,58 +2,132 @@
 # Fallback authentication service that works without database
 
 import jwt
-import bcrypt
-import uuid
 import json
 import os
-from datetime import datetime, timedelta
+import re
+import secrets
+import sqlite3
+import threading
+import time
+import hashlib
+from datetime import datetime
 from typing import Dict, Optional
+from utils.cache import TTLCache
+from .auth_service import _BCRYPT_POOL, _bcrypt_hash, _bcrypt_check
+
+# Compiled once at import instead of on every validate_email call
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+# All strength rules in one pass for ASCII passwords; the Unicode-aware per-class
+# checks decide everything else and explain rejections
+_PASSWORD_RE = re.compile(r'(?=.*[A-Z])(?=.*[a-z])(?=.*[0-9]).{8,}', re.DOTALL)
 
 class FallbackAuthService:
-    """Fallback JWT Authentication service with file-based storage"""
+    """Fallback JWT Authentication service with SQLite file storage"""
+    
+    # Max decoded tokens kept in memory
+    TOKEN_CACHE_SIZE = 4096
     
-    def __init__(self, secret_key: str, storage_file: str = 'data/users.json'):
+    # No Supabase backend; routes check these before talking to the database
+    supabase_url = None
+    supabase_key = None
+    
+    def __init__(self, secret_key: str, storage_file: str = 'data/users.db',
+                 jwt_cache_ttl: int = 60, bcrypt_cost: int = 12):
         self.secret_key = secret_key
         self.storage_file = storage_file
+        self.jwt_cache_ttl = jwt_cache_ttl
+        self.bcrypt_cost = bcrypt_cost
+        
+        # Decoded JWT payloads keyed by SHA-256(token), so repeat requests skip the HMAC check
+        self._token_cache = TTLCache(maxsize=self.TOKEN_CACHE_SIZE, ttl=jwt_cache_ttl)
+        
+        # Hash at the configured cost, checked against when no real hash exists.
+        # Computed in the background so startup isn't delayed.
+        self._dummy_hash = _BCRYPT_POOL.submit(_bcrypt_hash, secrets.token_bytes(16), bcrypt_cost)
         
         # Ensure storage directory exists
         os.makedirs(os.path.dirname(storage_file), exist_ok=True)
         
-        # Initialize storage file if it doesn't exist
-        if not os.path.exists(storage_file):
-            with open(storage_file, 'w') as f:
-                json.dump({}, f)
+        # One shared connection; sqlite3 serializes writes, the lock serializes cursors
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(storage_file, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        
+        with self._db_lock, self._db:
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS users (
+                    email TEXT PRIMARY KEY,
+                    id TEXT NOT NULL,
+                    password_hash TEXT,
+                    display_name TEXT,
+                    is_active INTEGER NOT NULL DEFAULT 1,
+                    created_at TEXT,
+                    last_login TEXT
+                )"""
+            )
+            # get_user_by_id runs on every authenticated request
+            self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_id ON users (id)")
+        
+        self._import_legacy_users()
     
-    def _load_users(self) -> Dict:
-        """Load users from file"""
+    def _import_legacy_users(self):
+        """Import users from the old JSON storage file, if one is still around"""
+        legacy_file = os.path.splitext(self.storage_file)[0] + '.json'
+        if not os.path.exists(legacy_file):
+            return
+        
         try:
-            with open(self.storage_file, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
+            with open(legacy_file, 'r') as f:
+                users = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return
+        
+        rows = [
+            (
+                email, user['id'], user.get('password_hash'), user.get('display_name'),
+                int(user.get('is_active', True)), user.get('created_at'), user.get('last_login')
+            )
+            for email, user in users.items()
+        ]
+        
+        with self._db_lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO users "
+                "(email, id, password_hash, display_name, is_active, created_at, last_login) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        
+        os.replace(legacy_file, legacy_file + '.migrated')
     
-    def _save_users(self, users: Dict):
-        """Save users to file"""
-        with open(self.storage_file, 'w') as f:
-            json.dump(users, f, indent=2, default=str)
+    def _fetch_user(self, column: str, value: str) -> Optional[Dict]:
+        """Fetch a single user row as a dict"""
+        with self._db_lock:
+            row = self._db.execute(f"SELECT * FROM users WHERE {column} = ?", (value,)).fetchone()
+        
+        if row is None:
+            return None
+        
+        user = dict(row)
+        user['is_active'] = bool(user['is_active'])
+        return user
     
     def hash_password(self, password: str) -> str:
         """Hash password with bcrypt"""
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-        return hashed.decode('utf-8')
+        return _BCRYPT_POOL.submit(_bcrypt_hash, password.encode('utf-8'), self.bcrypt_cost).result()
     
     def verify_password(self, password: str, hashed: str) -> bool:
         """Verify password against hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+        return _BCRYPT_POOL.submit(_bcrypt_check, password.encode('utf-8'), hashed.encode('utf-8')).result()
     
     def generate_token(self, user_id: str, email: str, expires_in_days: int = 7) -> str:
         """Generate JWT token"""
+        now = int(time.time())
         payload = {
             'user_id': user_id,
             'email': email,
-            'iat': datetime.utcnow(),
-            'exp': datetime.utcnow() + timedelta(days=expires_in_days),
+            'iat': now,
+            'exp': now + expires_in_days * 86400,
             'iss': 'typetutor-backend'
         }
         return jwt.encode(payload, self.secret_key, algorithm='HS256')
@@ -64,23 +138,29 @@ class FallbackAuthService:
             if token.startswith('Bearer '):
                 token = token[7:]
             
-            payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
+            cache_key = hashlib.sha256(token.encode('utf-8')).digest()
+            payload = self._token_cache.get(cache_key)
+            if payload is not None:
+                return payload
             
-            if datetime.utcnow() > datetime.fromtimestamp(payload['exp']):
-                return None
+            payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
             
+            # Only successful decodes are cached, never past the token's own expiry
+            ttl = min(self.jwt_cache_ttl, payload['exp'] - time.time())
+            self._token_cache.set(cache_key, payload, ttl=ttl)
             return payload
         except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
             return None
     
     def validate_email(self, email: str) -> bool:
         """Basic email validation"""
-        import re
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return re.match(pattern, email) is not None
+        return _EMAIL_RE.match(email) is not None
     
     def validate_password(self, password: str) -> Dict:
         """Validate password strength"""
+        if _PASSWORD_RE.fullmatch(password):
+            return {'valid': True, 'errors': []}
+        
         errors = []
         
         if len(password) < 8:
@@ -100,6 +180,10 @@ class FallbackAuthService:
     def create_user(self, email: str, password: str, display_name: str = None) -> Dict:
         """Create new user in file storage"""
         try:
+            # Normalize once; the local part keeps its original case for display
+            local_part = email.split('@', 1)[0]
+            email = email.lower()
+            
             # Validate email
             if not self.validate_email(email):
                 return {'success': False, 'error': 'Invalid email format'}
@@ -113,37 +197,38 @@ class FallbackAuthService:
                     'details': password_validation['errors']
                 }
             
-            # Load existing users
-            users = self._load_users()
-            
-            # Check if user already exists
-            if email.lower() in users:
-                return {'success': False, 'error': 'User with this email already exists'}
-            
             # Create user
-            user_id = str(uuid.uuid4())
+            user_id = secrets.token_hex(16)
             user_data = {
                 'id': user_id,
-                'email': email.lower(),
+                'email': email,
                 'password_hash': self.hash_password(password),
-                'display_name': display_name or email.split('@')[0],
+                'display_name': display_name or local_part,
                 'is_active': True,
                 'created_at': datetime.utcnow().isoformat(),
                 'last_login': None
             }
             
-            # Save user
-            users[email.lower()] = user_data
-            self._save_users(users)
+            # Save user; the email primary key rejects duplicates
+            try:
+                with self._db_lock, self._db:
+                    self._db.execute(
+                        "INSERT INTO users "
+                        "(email, id, password_hash, display_name, is_active, created_at, last_login) "
+                        "VALUES (:email, :id, :password_hash, :display_name, :is_active, :created_at, :last_login)",
+                        user_data
+                    )
+            except sqlite3.IntegrityError:
+                return {'success': False, 'error': 'User with this email already exists'}
             
             # Generate token
-            token = self.generate_token(user_id, email.lower())
+            token = self.generate_token(user_id, email)
             
             return {
                 'success': True,
                 'user': {
                     'id': user_id,
-                    'email': email.lower(),
+                    'email': email,
                     'display_name': user_data['display_name']
                 },
                 'token': token,
@@ -156,13 +241,15 @@ class FallbackAuthService:
     def authenticate_user(self, email: str, password: str) -> Dict:
         """Authenticate user"""
         try:
+            email = email.lower()
             if not self.validate_email(email):
                 return {'success': False, 'error': 'Invalid email format'}
             
-            users = self._load_users()
-            user = users.get(email.lower())
+            user = self.get_user_by_email(email)
             
-            if not user:
+            if not user or not user.get('password_hash'):
+                # Spend a real bcrypt check so unknown accounts can't be told apart by latency
+                self.verify_password(password, self._dummy_hash.result())
                 return {'success': False, 'error': 'Invalid email or password'}
             
             if not self.verify_password(password, user['password_hash']):
@@ -172,9 +259,7 @@ class FallbackAuthService:
                 return {'success': False, 'error': 'Account is deactivated'}
             
             # Update last login
-            user['last_login'] = datetime.utcnow().isoformat()
-            users[email.lower()] = user
-            self._save_users(users)
+            self.update_last_login(user['id'])
             
             # Generate token
             token = self.generate_token(user['id'], user['email'])
@@ -184,7 +269,7 @@ class FallbackAuthService:
                 'user': {
                     'id': user['id'],
                     'email': user['email'],
-                    'display_name': user.get('display_name', user['email'].split('@')[0])
+                    'display_name': user.get('display_name') or user['email'].split('@', 1)[0]
                 },
                 'token': token,
                 'message': 'Login successful'
@@ -195,16 +280,20 @@ class FallbackAuthService:
     
     def get_user_by_email(self, email: str) -> Optional[Dict]:
         """Get user by email"""
-        users = self._load_users()
-        return users.get(email.lower())
+        return self._fetch_user('email', email.lower())
     
     def get_user_by_id(self, user_id: str) -> Optional[Dict]:
         """Get user by ID"""
-        users = self._load_users()
-        for user in users.values():
-            if user.get('id') == user_id:
-                return user
-        return None
+        return self._fetch_user('id', user_id)
+    
+    def update_last_login(self, user_id: str) -> bool:
+        """Update user's last login timestamp"""
+        with self._db_lock, self._db:
+            cursor = self._db.execute(
+                "UPDATE users SET last_login = ? WHERE id = ?",
+                (datetime.utcnow().isoformat(), user_id)
+            )
+        return cursor.rowcount > 0
     
     def get_user_profile(self, user_id: str) -> Dict:
         """Get user profile"""
@@ -232,29 +321,23 @@ class FallbackAuthService:
         new_token = self.generate_token(payload['user_id'], payload['email'])
         return {'success': True, 'token': new_token, 'message': 'Token refreshed successfully'}
 
-# Update the main auth service to include fallback
-def get_auth_service_with_fallback():
-    """Get auth service with automatic fallback to file storage"""
-    from flask import current_app
+def init_auth_service_with_fallback(app):
+    """Pick the database or file-based auth backend once, at startup"""
+    from .auth_service import init_auth_service
     
-    secret_key = current_app.config.get('SECRET_KEY', 'dev-secret-key')
-    supabase_url = current_app.config.get('SUPABASE_URL')
-    supabase_key = current_app.config.get('SUPABASE_ANON_KEY')
+    # Use the database whenever it is configured; a transient outage at startup
+    # must not pin the process to local file storage for its lifetime
+    if app.config.get('SUPABASE_URL') and app.config.get('SUPABASE_ANON_KEY'):
+        print("✅ Using database authentication")
+        return app.extensions.get('auth_service') or init_auth_service(app)
     
-    # Try database first, fall back to file storage
-    if supabase_url and supabase_key:
-        try:
-            from .auth_service import AuthService
-            auth_service = AuthService(secret_key, supabase_url, supabase_key)
-            
-            # Test database connection
-            test_result = auth_service.get_user_by_email('test@nonexistent.com')
-            # If we get here without exception, database is working
-            return auth_service
-            
-        except Exception as e:
-            print(f"Database auth failed, using fallback: {e}")
+    print("📁 Using fallback file-based authentication")
+    auth_service = FallbackAuthService(
+        app.config.get('SECRET_KEY', 'dev-secret-key'),
+        jwt_cache_ttl=int(app.config.get('JWT_CACHE_TTL', 60)),
+        bcrypt_cost=int(app.config.get('BCRYPT_COST', 12))
+    )
     
-    # Use fallback file storage
-    print("Using fallback file-based authentication")
-    return FallbackAuthService(secret_key)
\ No newline at end of file
+    # Routes resolve the service through auth_service.get_auth_service
+    app.extensions['auth_service'] = auth_service
+    return auth_service
@@ -1,12 +1,196 @@
 from typing import Dict, List, Optional, Any
-from datetime import datetime, date
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import atexit
+import os
+import threading
 import uuid
 import json
+import zlib
 import logging
+try:
+    import asyncpg
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    ASYNCPG_AVAILABLE = False
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 from database.supabase_client import get_supabase
+from utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+def _json_dumps(obj) -> str:
+    """Encode a JSONB value once, with orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj)
+
+def encode_keystrokes(keystrokes: List) -> bytes:
+    """Delta-encode keystroke timestamps and deflate the log for the keystrokes_blob column"""
+    previous = 0
+    events = []
+    for event in keystrokes:
+        if isinstance(event, dict) and isinstance(event.get('timestamp'), (int, float)):
+            timestamp = event['timestamp']
+            event = dict(event, timestamp=timestamp - previous)
+            previous = timestamp
+        events.append(event)
+    return zlib.compress(_json_dumps(events).encode('utf-8'), 6)
+
+def decode_keystrokes(blob: bytes) -> List:
+    """Inverse of encode_keystrokes"""
+    events = json.loads(zlib.decompress(blob))
+    previous = 0
+    for event in events:
+        if isinstance(event, dict) and isinstance(event.get('timestamp'), (int, float)):
+            previous += event['timestamp']
+            event['timestamp'] = previous
+    return events
+
+class _SessionBatcher:
+    """Coalesces typing_sessions rows into multi-row inserts on a background thread"""
+    BATCH_SIZE = 50
+    COPY_COLUMNS = (
+        'id', 'user_id', 'session_type', 'content_type', 'content_preview',
+        'wpm', 'accuracy', 'duration_seconds', 'characters_typed', 'errors_count',
+        'corrections_count', 'keystrokes_blob', 'session_data'
+    )
+    
+    def __init__(self):
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        
+        # With a direct Postgres DSN, bulk rows are streamed with COPY instead of PostgREST
+        self._dsn = os.getenv('SUPABASE_DB_URL') if ASYNCPG_AVAILABLE else None
+        self._loop = None
+        self._pool = None
+        self._copy_lock = threading.Lock()
+    
+    def submit(self, row: Dict) -> Future:
+        """Queue a row for insertion; the future resolves to the inserted record"""
+        future = Future()
+        with self._cond:
+            self._pending.append((row, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='session-batcher', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+    
+    def _run(self):
+        while True:
+            # An idle queue is flushed at once; rows that arrive while a flush is
+            # in flight wait for it and then go out together in the next insert
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                
+                batch = [self._pending.popleft() for _ in range(min(self.BATCH_SIZE, len(self._pending)))]
+            
+            self._flush(batch)
+    
+    def _flush(self, batch):
+        if self._dsn:
+            try:
+                self._copy(batch)
+                return
+            except Exception as e:
+                logger.warning(f"COPY of {len(batch)} typing sessions failed, falling back to PostgREST: {e}")
+        
+        self._insert(batch)
+    
+    def _insert(self, batch):
+        """Insert a batch through PostgREST and resolve its futures"""
+        try:
+            # PostgREST takes bytea as a \x-prefixed hex string
+            rows = [dict(row, keystrokes_blob='\\x' + row['keystrokes_blob'].hex()) for row, _ in batch]
+            result = get_supabase().table('typing_sessions').insert(rows).execute()
+            inserted = result.data or []
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Error saving typing session: {e}")
+                batch[0][1].set_exception(e)
+                return
+            
+            # One bad row fails the whole insert; retry singly so each save gets its own result
+            logger.warning(f"Insert of {len(batch)} typing sessions failed, retrying individually: {e}")
+            for item in batch:
+                self._insert([item])
+            return
+        
+        # PostgREST returns inserted rows in request order
+        for i, (_, future) in enumerate(batch):
+            if i < len(inserted):
+                future.set_result(inserted[i])
+            else:
+                future.set_exception(Exception("Failed to save session"))
+
+    def _copy(self, batch):
+        """Stream a batch straight into typing_sessions with binary COPY"""
+        # COPY returns nothing, so ids are assigned here rather than by the column default
+        records = []
+        for row, _ in batch:
+            row['id'] = str(uuid.uuid4())
+            records.append((
+                row['id'], row['user_id'], row['session_type'], row['content_type'],
+                row['content_preview'], row['wpm'], row['accuracy'], row['duration_seconds'],
+                row['characters_typed'], row['errors_count'], row['corrections_count'],
+                row['keystrokes_blob'], _json_dumps(row['session_data'])
+            ))
+        
+        with self._copy_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+            if self._pool is None:
+                self._pool = self._loop.run_until_complete(
+                    asyncpg.create_pool(self._dsn, min_size=1, max_size=2)
+                )
+            
+            self._loop.run_until_complete(self._pool.copy_records_to_table(
+                'typing_sessions', records=records, columns=self.COPY_COLUMNS
+            ))
+        
+        for row, future in batch:
+            future.set_result(row)
+    
+    def close(self):
+        """Close the COPY connection pool and its event loop"""
+        with self._copy_lock:
+            if self._loop is None:
+                return
+            try:
+                if self._pool is not None:
+                    self._loop.run_until_complete(self._pool.close())
+            except Exception as e:
+                logger.warning(f"Error closing COPY connection pool: {e}")
+            finally:
+                self._loop.close()
+                self._loop = None
+                self._pool = None
+
+_session_batcher = _SessionBatcher()
+atexit.register(_session_batcher.close)
+
+# The achievement catalog changes rarely; share it across requests for a few minutes
+ACHIEVEMENTS_CACHE_TTL = 300
+_achievements_cache = TTLCache(maxsize=1, ttl=ACHIEVEMENTS_CACHE_TTL)
+
+# Resolved users by username, so repeat saves skip the users round-trip
+USER_CACHE_TTL = 60
+_user_cache = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL)
+
+# Award RPCs run after the save has returned; awards are announced by pg_notify
+_achievement_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='achievements')
+
+# Achievements each user has yet to earn, to rule out the award RPC cheaply
+_unearned_cache = TTLCache(maxsize=10000, ttl=ACHIEVEMENTS_CACHE_TTL)
+
 class DatabaseService:
     def __init__(self):
         self.supabase = get_supabase()
@@ -15,25 +199,19 @@ class DatabaseService:
     # User Management
     async def get_or_create_user(self, user_identifier: str = "anonymous") -> Dict:
         """Get existing user or create anonymous user"""
+        user = _user_cache.get(user_identifier)
+        if user is not None:
+            return user
+        
         try:
-            # Try to find existing user
-            result = self.supabase.table('users').select('*').eq('username', user_identifier).execute()
-            
-            if result.data:
-                return result.data[0]
-            
-            # Create new anonymous user
-            user_data = {
-                'username': user_identifier,
-                'is_anonymous': True,
-                'preferences': {}
-            }
-            
-            result = self.supabase.table('users').insert(user_data).execute()
+            # Insert-or-return in one round-trip; a no-op update on conflict makes the
+            # existing row come back, and a trigger seeds user_statistics for new users
+            result = self.supabase.table('users')\
+                .upsert({'username': user_identifier}, on_conflict='username', ignore_duplicates=False)\
+                .execute()
             
             if result.data:
-                # Initialize user statistics
-                await self.init_user_statistics(result.data[0]['id'])
+                _user_cache.set(user_identifier, result.data[0])
                 return result.data[0]
             
             raise Exception("Failed to create user")
@@ -42,9 +220,10 @@ class DatabaseService:
             self.logger.error(f"Error in get_or_create_user: {e}")
             raise
     
-    async def init_user_statistics(self, user_id: str):
-        """Initialize user statistics"""
-        stats_data = {
+    @staticmethod
+    def _empty_statistics(user_id: str) -> Dict:
+        """Statistics row for a user with no sessions yet"""
+        return {
             'user_id': user_id,
             'total_sessions': 0,
             'total_practice_time_minutes': 0,
@@ -52,13 +231,25 @@ class DatabaseService:
             'best_wpm': 0,
             'average_accuracy': 0,
             'best_accuracy': 0,
+            'ema_wpm': None,
+            'ema_accuracy': None,
             'current_streak': 0,
             'longest_streak': 0
         }
+    
+    async def init_user_statistics(self, user_id: str) -> Dict:
+        """Initialize user statistics"""
+        stats_data = self._empty_statistics(user_id)
         
-        self.supabase.table('user_statistics').insert(stats_data).execute()
+        result = self.supabase.table('user_statistics').insert(stats_data).execute()
+        return result.data[0] if result.data else stats_data
     
     # Session Management
+    @staticmethod
+    def _content_preview(content) -> str:
+        """Bound the stored preview to the varchar(100) column"""
+        return str(content)[:100] if content else ''
+    
     async def save_typing_session(self, session_data: Dict) -> Dict:
         """Save typing session to database"""
         try:
@@ -70,148 +261,94 @@ class DatabaseService:
                 'user_id': user['id'],
                 'session_type': session_data.get('sessionType', 'practice'),
                 'content_type': session_data.get('contentType', 'custom'),
-                'content_preview': str(session_data.get('contentPreview', ''))[:100],
+                'content_preview': self._content_preview(session_data.get('contentPreview')),
                 'wpm': int(session_data['wpm']),
                 'accuracy': int(session_data['accuracy']),
                 'duration_seconds': float(session_data['duration']),
                 'characters_typed': session_data.get('charactersTyped', 0),
                 'errors_count': session_data.get('errorsCount', 0),
                 'corrections_count': session_data.get('correctionsCount', 0),
-                'keystrokes': session_data.get('keystrokes', []),
+                'keystrokes_blob': encode_keystrokes(session_data.get('keystrokes', [])),
                 'session_data': {
                     'device_info': session_data.get('deviceInfo', {}),
                     'practice_mode': session_data.get('practiceMode', 'paragraph')
                 }
             }
             
-            # Save session
-            result = self.supabase.table('typing_sessions').insert(db_session).execute()
+            # Save session as part of the next batched insert
+            saved = await asyncio.wrap_future(_session_batcher.submit(db_session))
             
-            if result.data:
-                # Update user statistics
-                await self.update_user_statistics(user['id'], session_data)
-                # Check for achievements
-                new_achievements = await self.check_achievements(user['id'], session_data)
-                return {
-                    'success': True, 
-                    'session_id': result.data[0]['id'],
-                    'new_achievements': new_achievements
-                }
+            user_stats = await self.update_user_statistics(user['id'], session_data)
             
-            raise Exception("Failed to save session")
+            # Awards are pushed on the 'achievement' channel, keeping the award RPC off the save path;
+            # a cached unearned list that nothing in this session can reach skips it entirely
+            unearned = _unearned_cache.get(user['id'])
+            if unearned is None or self._achievement_in_reach(unearned, session_data, user_stats):
+                future = _achievement_executor.submit(
+                    self._award_achievements, user['id'], session_data, user_stats
+                )
+                future.add_done_callback(self._log_award_failure)
+            return {
+                'success': True, 
+                'session_id': saved['id']
+            }
             
         except Exception as e:
             self.logger.error(f"Error saving session: {e}")
             raise
     
-    async def update_user_statistics(self, user_id: str, session_data: Dict):
-        """Update user statistics after session"""
+    async def update_user_statistics(self, user_id: str, session_data: Dict) -> Dict:
+        """Update user statistics after session and return the updated row"""
         try:
-            # Get current stats
-            stats_result = self.supabase.table('user_statistics').select('*').eq('user_id', user_id).execute()
-            
-            if not stats_result.data:
-                await self.init_user_statistics(user_id)
-                stats_result = self.supabase.table('user_statistics').select('*').eq('user_id', user_id).execute()
-            
-            current_stats = stats_result.data[0]
-            
-            # Calculate new statistics
-            total_sessions = current_stats['total_sessions'] + 1
-            
-            # Update averages
-            old_avg_wpm = current_stats['average_wpm']
-            old_avg_accuracy = current_stats['average_accuracy']
-            
-            new_avg_wpm = ((old_avg_wpm * (total_sessions - 1)) + session_data['wpm']) / total_sessions
-            new_avg_accuracy = ((old_avg_accuracy * (total_sessions - 1)) + session_data['accuracy']) / total_sessions
+            # Counters and averages are folded in by one atomic upsert; streaks are kept by a trigger
+            result = await asyncio.to_thread(self.supabase.rpc('update_user_stats', {
+                'p_user_id': user_id,
+                'p_wpm': int(session_data['wpm']),
+                'p_accuracy': int(session_data['accuracy']),
+                'p_duration': float(session_data['duration'])
+            }).execute)
             
-            # Update practice time
-            practice_minutes = current_stats['total_practice_time_minutes'] + max(1, int(session_data['duration'] / 60))
-            
-            # Update streak
-            today = date.today()
-            last_practice = current_stats.get('last_practice_date')
-            current_streak = current_stats['current_streak']
-            
-            if last_practice:
-                if isinstance(last_practice, str):
-                    last_date = datetime.fromisoformat(last_practice).date()
-                else:
-                    last_date = last_practice
-                
-                days_diff = (today - last_date).days
-                if days_diff == 0:
-                    pass  # Same day
-                elif days_diff == 1:
-                    current_streak += 1
-                else:
-                    current_streak = 1
-            else:
-                current_streak = 1
-            
-            # Prepare update data
-            update_data = {
-                'total_sessions': total_sessions,
-                'total_practice_time_minutes': practice_minutes,
-                'average_wpm': round(new_avg_wpm, 2),
-                'average_accuracy': round(new_avg_accuracy, 2),
-                'best_wpm': max(current_stats['best_wpm'], session_data['wpm']),
-                'best_accuracy': max(current_stats['best_accuracy'], session_data['accuracy']),
-                'current_streak': current_streak,
-                'longest_streak': max(current_stats['longest_streak'], current_streak),
-                'last_practice_date': today.isoformat(),
-                'updated_at': datetime.now().isoformat()
-            }
-            
-            # Update statistics
-            self.supabase.table('user_statistics').update(update_data).eq('user_id', user_id).execute()
+            return result.data[0] if result.data else {}
             
         except Exception as e:
             self.logger.error(f"Error updating statistics: {e}")
             raise
     
     # Statistics Retrieval
+    @staticmethod
+    def _embedded_one(value) -> Optional[Dict]:
+        """One-to-one embeds come back as an object on newer PostgREST, a list on older"""
+        if isinstance(value, list):
+            return value[0] if value else None
+        return value
+    
     async def get_user_statistics(self, user_id: str = "anonymous") -> Dict:
         """Get user statistics"""
         try:
-            user = await self.get_or_create_user(user_id)
-            
-            # Get statistics
-            stats_result = self.supabase.table('user_statistics').select('*').eq('user_id', user['id']).execute()
-            
-            if not stats_result.data:
-                await self.init_user_statistics(user['id'])
-                stats_result = self.supabase.table('user_statistics').select('*').eq('user_id', user['id']).execute()
-            
-            stats = stats_result.data[0]
-            
-            # Get recent sessions
-            sessions_result = self.supabase.table('typing_sessions')\
-                .select('*')\
-                .eq('user_id', user['id'])\
-                .order('created_at', desc=True)\
-                .limit(5)\
+            # User, statistics and the trigger-maintained recent sessions in one select
+            result = self.supabase.table('users')\
+                .select('id, user_statistics(*), user_dashboard_cache(recent_sessions)')\
+                .eq('username', user_id)\
                 .execute()
             
-            # Format recent sessions
-            recent_sessions = []
-            for session in sessions_result.data:
-                duration = session['duration_seconds']
-                minutes = int(duration // 60)
-                seconds = int(duration % 60)
+            if result.data:
+                row = result.data[0]
+                stats = self._embedded_one(row.get('user_statistics'))
+                dashboard = self._embedded_one(row.get('user_dashboard_cache')) or {}
+                recent_sessions = dashboard.get('recent_sessions') or []
                 
-                recent_sessions.append({
-                    'date': session['created_at'][:10],
-                    'duration': f"{minutes}m {seconds}s",
-                    'wpm': session['wpm'],
-                    'accuracy': session['accuracy'],
-                    'mode': session['content_type'].title()
-                })
+                if not stats:
+                    stats = await self.init_user_statistics(row['id'])
+            else:
+                # New users get their statistics row initialized on creation
+                user = await self.get_or_create_user(user_id)
+                stats = self._empty_statistics(user['id'])
+                recent_sessions = []
             
             return {
-                'averageWpm': int(stats['average_wpm']),
-                'accuracy': int(stats['average_accuracy']),
+                # Moving averages track recent form; rows predating them fall back to the mean
+                'averageWpm': int(stats.get('ema_wpm') or stats['average_wpm']),
+                'accuracy': int(stats.get('ema_accuracy') or stats['average_accuracy']),
                 'practiceMinutes': stats['total_practice_time_minutes'],
                 'currentStreak': stats['current_streak'],
                 'totalSessions': stats['total_sessions'],
@@ -221,7 +358,7 @@ class DatabaseService:
                 'personalBest': {
                     'wpm': stats['best_wpm'],
                     'accuracy': stats['best_accuracy'],
-                    'date': stats['last_practice_date']
+                    'date': stats.get('last_practice_date')
                 }
             }
             
@@ -230,68 +367,28 @@ class DatabaseService:
             raise
     
     # Achievement System
-    async def check_achievements(self, user_id: str, session_data: Dict) -> List[Dict]:
+    async def check_achievements(self, user_id: str, session_data: Dict,
+                                 user_stats: Optional[Dict] = None) -> List[Dict]:
         """Check for new achievements after a session"""
         try:
-            # Get user's current achievements
-            user_achievements_result = self.supabase.table('user_achievements')\
-                .select('achievement_id')\
-                .eq('user_id', user_id)\
-                .eq('status', 'earned')\
-                .execute()
-            
-            earned_achievement_ids = {ach['achievement_id'] for ach in user_achievements_result.data}
-            
-            # Get all available achievements
-            achievements_result = self.supabase.table('achievements')\
-                .select('*')\
-                .eq('is_active', True)\
-                .execute()
-            
-            # Get current user stats for checking
-            stats_result = self.supabase.table('user_statistics').select('*').eq('user_id', user_id).execute()
-            user_stats = stats_result.data[0] if stats_result.data else {}
+            awarded_ids = await asyncio.to_thread(self._award_achievements, user_id, session_data, user_stats)
+            if not awarded_ids:
+                return []
             
+            catalog = await self.get_active_achievements()
             new_achievements = []
-            
-            for achievement in achievements_result.data:
-                if achievement['id'] in earned_achievement_ids:
+            for achievement_id in awarded_ids:
+                achievement = catalog.get(achievement_id)
+                if achievement is None:
                     continue
-                
-                earned = False
-                category = achievement['category']
-                criteria = achievement['criteria']
-                
-                if category == 'speed':
-                    earned = session_data['wpm'] >= criteria.get('min_wpm', 0)
-                elif category == 'accuracy':
-                    earned = session_data['accuracy'] >= criteria.get('min_accuracy', 0)
-                elif category == 'streak':
-                    earned = user_stats.get('current_streak', 0) >= criteria.get('days', 0)
-                elif category == 'milestone':
-                    earned = user_stats.get('total_sessions', 0) >= criteria.get('session_count', 0)
-                
-                if earned:
-                    # Award achievement
-                    achievement_data = {
-                        'user_id': user_id,
-                        'achievement_id': achievement['id'],
-                        'progress_value': achievement['target_value'],
-                        'progress_percentage': 100,
-                        'status': 'earned',
-                        'earned_at': datetime.now().isoformat()
-                    }
-                    
-                    self.supabase.table('user_achievements').insert(achievement_data).execute()
-                    
-                    new_achievements.append({
-                        'id': achievement['id'],
-                        'title': achievement['title'],
-                        'description': achievement['description'],
-                        'icon': achievement['icon'],
-                        'points': achievement['points'],
-                        'rarity': achievement['rarity']
-                    })
+                new_achievements.append({
+                    'id': achievement['id'],
+                    'title': achievement['title'],
+                    'description': achievement['description'],
+                    'icon': achievement['icon'],
+                    'points': achievement['points'],
+                    'rarity': achievement['rarity']
+                })
             
             return new_achievements
             
@@ -299,6 +396,85 @@ class DatabaseService:
             self.logger.error(f"Error checking achievements: {e}")
             return []
     
+    @staticmethod
+    def _award_params(user_id: str, session_data: Dict, user_stats: Optional[Dict]) -> Dict:
+        """Arguments for the check_and_award_achievements RPC"""
+        return {
+            'p_user_id': user_id,
+            'p_session_wpm': int(session_data['wpm']),
+            'p_session_accuracy': int(session_data['accuracy']),
+            'p_current_streak': user_stats.get('current_streak') if user_stats else None,
+            'p_total_sessions': user_stats.get('total_sessions') if user_stats else None
+        }
+    
+    def _award_achievements(self, user_id: str, session_data: Dict,
+                            user_stats: Optional[Dict]) -> List[str]:
+        """Award whatever this session earned and return the new achievement ids (blocking)"""
+        unearned = self._unearned_achievements(user_id)
+        if not self._achievement_in_reach(unearned, session_data, user_stats):
+            return []
+        
+        # Criteria are evaluated and newly earned rows inserted in one round-trip
+        result = self.supabase.rpc(
+            'check_and_award_achievements', self._award_params(user_id, session_data, user_stats)
+        ).execute()
+        
+        awarded_ids = [row['achievement_id'] for row in result.data or []]
+        if awarded_ids:
+            _unearned_cache.set(user_id, [a for a in unearned if a['id'] not in awarded_ids])
+        return awarded_ids
+    
+    def _log_award_failure(self, future: Future):
+        """Done-callback for background awards, which have no caller to report to"""
+        error = future.exception()
+        if error is not None:
+            self.logger.error(f"Error awarding achievements: {error}")
+    
+    def _unearned_achievements(self, user_id: str) -> List[Dict]:
+        """Active achievements the user has not earned yet, anti-joined server-side (blocking)"""
+        unearned = _unearned_cache.get(user_id)
+        if unearned is None:
+            result = self.supabase.rpc('unearned_achievements', {'p_user_id': user_id}).execute()
+            unearned = result.data or []
+            _unearned_cache.set(user_id, unearned)
+        return unearned
+    
+    @staticmethod
+    def _achievement_in_reach(unearned: List[Dict], session_data: Dict,
+                              user_stats: Optional[Dict]) -> bool:
+        """Whether any unearned achievement's threshold could be met by this session"""
+        # Streak and milestone progress is unknown without stats, so those never rule anything out
+        progress = {
+            'speed': ('min_wpm', session_data['wpm']),
+            'accuracy': ('min_accuracy', session_data['accuracy']),
+            'streak': ('days', user_stats.get('current_streak') if user_stats else None),
+            'milestone': ('session_count', user_stats.get('total_sessions') if user_stats else None)
+        }
+        
+        for achievement in unearned:
+            if achievement['category'] not in progress:
+                continue
+            
+            criterion, value = progress[achievement['category']]
+            if value is None or value >= (achievement['criteria'] or {}).get(criterion, 0):
+                return True
+        
+        return False
+    
+    async def get_active_achievements(self) -> Dict[str, Dict]:
+        """Get the active achievement catalog keyed by id"""
+        catalog = _achievements_cache.get('active')
+        if catalog is None:
+            result = self.supabase.table('achievements').select('*').eq('is_active', True).execute()
+            catalog = {achievement['id']: achievement for achievement in result.data}
+            _achievements_cache.set('active', catalog)
+        return catalog
+    
+    @staticmethod
+    def invalidate_achievements_cache():
+        """Drop the cached catalog after achievements are edited"""
+        _achievements_cache.clear()
+    
     async def get_user_achievements(self, user_id: str) -> List[Dict]:
         """Get user's earned achievements"""
         try:
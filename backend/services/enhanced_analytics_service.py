@@ -1,11 +1,20 @@
+import asyncio
+import atexit
+import copy
 import json
 import os
+import re
 import uuid
 import sys
+import hashlib
+import heapq
+import threading
+import time
 from datetime import datetime, timedelta, date
 from typing import Dict, List, Optional, Tuple
 import math
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
+from concurrent.futures import Future
 
 # Add the backend directory to the path if not already there
 backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -19,6 +28,19 @@ except ImportError:
     def get_logger(name):
         return logging.getLogger(name)
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    # Windows: appends are only serialized within this process
+    FCNTL_AVAILABLE = False
+
 try:
     from models.typing_session import TypingSession
     from models.user_stats import UserStats
@@ -30,16 +52,449 @@ except ImportError:
     MODELS_AVAILABLE = False
     print("Warning: Advanced models not available, using basic mode")
 
+# Appends and compaction of the session logs must not interleave; across worker
+# processes the same is enforced with flock on the shard itself
+_sessions_lock = threading.Lock()
+
+# Parsed session shards keyed by path, valid while the file's (inode, mtime, size) is unchanged
+SHARD_CACHE_MAXSIZE = 256
+_shard_cache: 'OrderedDict[str, Tuple[Tuple[int, int, int], List[Dict]]]' = OrderedDict()
+_shard_cache_lock = threading.Lock()
+
+# Criteria key holding each achievement category's threshold
+_CATEGORY_CRITERIA = {
+    'speed': 'minWpm',
+    'accuracy': 'minAccuracy',
+    'streak': 'days',
+    'milestone': 'sessionCount'
+}
+# Available achievements and their per-category ladders, built on first use
+_available_achievements = None
+_achievements_by_category = None
+
+# Built-in achievements, shared read-only by every caller
+_DEFAULT_ACHIEVEMENTS = (
+    # Speed achievements
+    {
+        'id': 'speed_20',
+        'title': 'Speed Novice',
+        'description': 'Reach 20 WPM',
+        'category': 'speed',
+        'criteria': {'minWpm': 20},
+        'icon': '🐢',
+        'points': 10
+    },
+    {
+        'id': 'speed_40',
+        'title': 'Speed Apprentice',
+        'description': 'Reach 40 WPM',
+        'category': 'speed',
+        'criteria': {'minWpm': 40},
+        'icon': '🏃',
+        'points': 20
+    },
+    {
+        'id': 'speed_60',
+        'title': 'Speed Expert',
+        'description': 'Reach 60 WPM',
+        'category': 'speed',
+        'criteria': {'minWpm': 60},
+        'icon': '⚡',
+        'points': 50
+    },
+    {
+        'id': 'speed_80',
+        'title': 'Speed Demon',
+        'description': 'Reach 80 WPM',
+        'category': 'speed',
+        'criteria': {'minWpm': 80},
+        'icon': '🔥',
+        'points': 100
+    },
+    
+    # Accuracy achievements
+    {
+        'id': 'accuracy_90',
+        'title': 'Precision Rookie',
+        'description': 'Achieve 90% accuracy',
+        'category': 'accuracy',
+        'criteria': {'minAccuracy': 90},
+        'icon': '🎯',
+        'points': 15
+    },
+    {
+        'id': 'accuracy_95',
+        'title': 'Accuracy Expert',
+        'description': 'Achieve 95% accuracy',
+        'category': 'accuracy',
+        'criteria': {'minAccuracy': 95},
+        'icon': '💎',
+        'points': 30
+    },
+    {
+        'id': 'accuracy_99',
+        'title': 'Near Perfect',
+        'description': 'Achieve 99% accuracy',
+        'category': 'accuracy',
+        'criteria': {'minAccuracy': 99},
+        'icon': '🌟',
+        'points': 75
+    },
+    
+    # Streak achievements
+    {
+        'id': 'streak_3',
+        'title': 'Getting Started',
+        'description': 'Practice 3 days in a row',
+        'category': 'streak',
+        'criteria': {'days': 3},
+        'icon': '📅',
+        'points': 20
+    },
+    {
+        'id': 'streak_7',
+        'title': 'Week Warrior',
+        'description': 'Practice 7 days in a row',
+        'category': 'streak',
+        'criteria': {'days': 7},
+        'icon': '🗓️',
+        'points': 50
+    },
+    
+    # Milestone achievements
+    {
+        'id': 'milestone_1',
+        'title': 'First Steps',
+        'description': 'Complete your first session',
+        'category': 'milestone',
+        'criteria': {'sessionCount': 1},
+        'icon': '🎉',
+        'points': 5
+    },
+    {
+        'id': 'milestone_10',
+        'title': 'Dedicated Learner',
+        'description': 'Complete 10 sessions',
+        'category': 'milestone',
+        'criteria': {'sessionCount': 10},
+        'icon': '📚',
+        'points': 25
+    },
+    {
+        'id': 'milestone_50',
+        'title': 'Typing Enthusiast',
+        'description': 'Complete 50 sessions',
+        'category': 'milestone',
+        'criteria': {'sessionCount': 50},
+        'icon': '🏅',
+        'points': 100
+    }
+)
+
+# User ids that can be used as shard file names verbatim
+_SAFE_USER_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# Parsed user stats and goals keyed by their file path, with the (inode, mtime, size)
+# of the file they match so writes from other processes are picked up. Dirty entries
+# have no file version yet and are written by a background flusher
+RECORD_CACHE_MAXSIZE = 10000
+RECORD_FLUSH_INTERVAL = 2.0
+_record_cache: 'OrderedDict[str, Tuple[Optional[Tuple[int, int, int]], Dict]]' = OrderedDict()
+_record_dirty = set()
+_record_cache_lock = threading.Lock()
+_record_flusher = None
+
+def _json_dumps(obj) -> bytes:
+    """Encode a stored record compactly, with orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(',', ':'), default=str).encode('utf-8')
+
+def _json_loads(data: bytes):
+    """Decode a stored record"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+def _file_version(st: os.stat_result) -> Tuple[int, int, int]:
+    """Identity of one version of a file's contents"""
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def _atomic_write(path: str, data: bytes) -> os.stat_result:
+    """Replace a file's contents so readers never see a partial write; returns the new file's stat"""
+    # Unique per writer so concurrent rewrites of one file don't share a temp file
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        # Only the data has to be durable before the rename; fdatasync skips the metadata flush
+        _fdatasync(f.fileno())
+        st = os.fstat(f.fileno())
+    os.replace(tmp_path, path)
+    return st
+
+def _completed_epoch(session: Dict) -> int:
+    """Server-stamped unix seconds of a session; legacy records fall back to their completedAt"""
+    epoch = session.get('completedAtEpoch')
+    if epoch is None:
+        completed_at = session.get('completedAt')
+        try:
+            completed_dt = completed_at if isinstance(completed_at, datetime) else datetime.fromisoformat(completed_at)
+        except (TypeError, ValueError):
+            completed_dt = datetime(2020, 1, 1)
+        epoch = session['completedAtEpoch'] = int(completed_dt.timestamp())
+    return epoch
+
+def _sessions_since(sessions: List[Dict], cutoff_epoch: int) -> List[Dict]:
+    """Sessions saved at or after cutoff_epoch, found by binary search on a shard in save order"""
+    lo, hi = 0, len(sessions)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _completed_epoch(sessions[mid]) < cutoff_epoch:
+            lo = mid + 1
+        else:
+            hi = mid
+    return sessions[lo:]
+
+def _safe_filename(user_id: str) -> str:
+    """File name stem for a user id, hashed when not filesystem-safe"""
+    user_id = str(user_id)
+    if _SAFE_USER_ID.match(user_id):
+        return user_id
+    return hashlib.sha256(user_id.encode('utf-8')).hexdigest()
+
+def _get_record(path: str) -> Optional[Dict]:
+    """Get a copy of a cached JSON record, reloading it from disk when the file has changed"""
+    try:
+        disk_version = _file_version(os.stat(path))
+    except FileNotFoundError:
+        disk_version = None
+    
+    with _record_cache_lock:
+        entry = _record_cache.get(path)
+        if entry is not None:
+            # Unflushed local updates are newer than the file
+            if path in _record_dirty or entry[0] == disk_version:
+                _record_cache.move_to_end(path)
+                return copy.deepcopy(entry[1])
+            del _record_cache[path]
+    
+    try:
+        with open(path, 'rb') as f:
+            version = _file_version(os.fstat(f.fileno()))
+            record = _json_loads(f.read())
+    except (json.JSONDecodeError, FileNotFoundError):
+        return None
+    
+    with _record_cache_lock:
+        entry = _record_cache.get(path)
+        if entry is not None and path in _record_dirty:
+            # A local update landed while the file was being read
+            return copy.deepcopy(entry[1])
+        _record_cache[path] = (version, record)
+        _record_cache.move_to_end(path)
+        _evict_clean_records()
+    # Callers mutate what they get while the flusher may be serializing the cached object
+    return copy.deepcopy(record)
+
+def _put_record(path: str, record: Dict):
+    """Cache a private copy of a JSON record and schedule it for writing"""
+    record = copy.deepcopy(record)
+    with _record_cache_lock:
+        _record_cache[path] = (None, record)
+        _record_cache.move_to_end(path)
+        _record_dirty.add(path)
+        _evict_clean_records()
+    _ensure_record_flusher()
+
+def _delete_record(path: str):
+    """Drop a JSON record from the cache and disk"""
+    with _record_cache_lock:
+        _record_cache.pop(path, None)
+        _record_dirty.discard(path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _evict_clean_records():
+    """Trim the cache to size, oldest first, never dropping unflushed entries; caller holds the lock"""
+    excess = len(_record_cache) - RECORD_CACHE_MAXSIZE
+    if excess <= 0:
+        return
+    for path in [p for p in _record_cache if p not in _record_dirty][:excess]:
+        del _record_cache[path]
+
+def _flush_records():
+    """Write every dirty cached record to its file"""
+    with _record_cache_lock:
+        pending = {path: _record_cache[path][1] for path in _record_dirty if path in _record_cache}
+        _record_dirty.clear()
+    
+    for path, record in pending.items():
+        try:
+            st = _atomic_write(path, _json_dumps(record))
+        except Exception as e:
+            get_logger(__name__).error(f"Error writing {path}: {e}")
+            # Keep it dirty so the next flush retries instead of reloading the stale file
+            with _record_cache_lock:
+                if path in _record_cache:
+                    _record_dirty.add(path)
+            continue
+        
+        with _record_cache_lock:
+            entry = _record_cache.get(path)
+            # Tag the entry with the file it now matches, unless it changed again meanwhile
+            if entry is not None and entry[1] is record and path not in _record_dirty:
+                _record_cache[path] = (_file_version(st), record)
+
+def _run_record_flusher():
+    while True:
+        time.sleep(RECORD_FLUSH_INTERVAL)
+        try:
+            _flush_records()
+        except Exception as e:
+            get_logger(__name__).error(f"Error flushing analytics records: {e}")
+
+def _ensure_record_flusher():
+    global _record_flusher
+    if _record_flusher is None:
+        _record_flusher = threading.Thread(target=_run_record_flusher, name='analytics-flusher', daemon=True)
+        _record_flusher.start()
+
+atexit.register(_flush_records)
+
+class _SessionAppender:
+    """Coalesces session log appends so a burst costs one write per shard"""
+    BATCH_SIZE = 100
+    FLUSH_INTERVAL = 0.05
+    MAX_OPEN_FILES = 256
+    
+    def __init__(self):
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        
+        # Append-mode descriptors per shard, least recently written first; guarded by _sessions_lock
+        self._fds: 'OrderedDict[str, int]' = OrderedDict()
+    
+    def submit(self, path: str, line: bytes) -> Future:
+        """Queue a line for appending to path; the future resolves once it is written"""
+        future = Future()
+        with self._cond:
+            self._pending.append((path, line, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='session-appender', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                
+                # Linger briefly so concurrent saves share one write
+                deadline = time.monotonic() + self.FLUSH_INTERVAL
+                while len(self._pending) < self.BATCH_SIZE:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                
+                batch = [self._pending.popleft() for _ in range(min(self.BATCH_SIZE, len(self._pending)))]
+            
+            self._flush(batch)
+    
+    def _flush(self, batch):
+        by_path = defaultdict(list)
+        for path, line, future in batch:
+            by_path[path].append((line, future))
+        
+        for path, entries in by_path.items():
+            try:
+                with _sessions_lock:
+                    self._write(path, b''.join(line for line, _ in entries))
+            except Exception as e:
+                for _, future in entries:
+                    future.set_exception(e)
+                continue
+            
+            for _, future in entries:
+                future.set_result(None)
+    
+    def _write(self, path: str, data: bytes):
+        """Append to a shard through its cached descriptor; caller holds _sessions_lock"""
+        while True:
+            fd = self._fds.get(path)
+            if fd is None:
+                fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                self._fds[path] = fd
+                if len(self._fds) > self.MAX_OPEN_FILES:
+                    os.close(self._fds.popitem(last=False)[1])
+            else:
+                self._fds.move_to_end(path)
+            
+            if not FCNTL_AVAILABLE:
+                break
+            
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # Another worker may have compacted or reset the shard since this descriptor was opened
+            try:
+                current_inode = os.stat(path).st_ino
+            except FileNotFoundError:
+                current_inode = None
+            if current_inode == os.fstat(fd).st_ino:
+                break
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            self.close(path)
+        
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+    
+    def close(self, path: Optional[str] = None):
+        """Close one shard's descriptor, or all of them; caller holds _sessions_lock"""
+        paths = [path] if path is not None else list(self._fds)
+        for p in paths:
+            fd = self._fds.pop(p, None)
+            if fd is not None:
+                os.close(fd)
+
+_session_appender = _SessionAppender()
+
+def _close_session_files():
+    with _sessions_lock:
+        _session_appender.close()
+
+atexit.register(_close_session_files)
+
 class EnhancedAnalyticsService:
     """Enhanced analytics service with fallback for missing dependencies"""
     
+    MAX_SESSIONS_PER_USER = 1000
+    PRUNE_EVERY = 100
+    
     def __init__(self, storage_path: str = 'data'):
         self.storage_path = storage_path
         self.logger = get_logger(__name__)
-        self.sessions_file = os.path.join(storage_path, 'typing_sessions.json')
-        self.users_file = os.path.join(storage_path, 'user_stats.json')
+        self.sessions_dir = os.path.join(storage_path, 'sessions')
+        self.legacy_sessions_files = [
+            os.path.join(storage_path, 'typing_sessions.json'),
+            os.path.join(storage_path, 'typing_sessions.jsonl')
+        ]
+        self.users_dir = os.path.join(storage_path, 'users')
+        self.legacy_users_file = os.path.join(storage_path, 'user_stats.json')
         self.achievements_file = os.path.join(storage_path, 'achievements.json')
-        self.goals_file = os.path.join(storage_path, 'goals.json')
+        self.goals_dir = os.path.join(storage_path, 'goals')
+        self.legacy_goals_file = os.path.join(storage_path, 'goals.json')
         
         # Ensure storage directory exists
         os.makedirs(storage_path, exist_ok=True)
@@ -49,68 +504,235 @@ class EnhancedAnalyticsService:
     
     def _initialize_storage(self):
         """Initialize storage files if they don't exist"""
-        if not os.path.exists(self.sessions_file):
-            with open(self.sessions_file, 'w') as f:
-                json.dump([], f)
+        if not os.path.isdir(self.sessions_dir):
+            os.makedirs(self.sessions_dir, exist_ok=True)
+            self._migrate_legacy_sessions()
         
-        if not os.path.exists(self.users_file):
-            with open(self.users_file, 'w') as f:
-                json.dump({}, f)
+        if not os.path.isdir(self.users_dir):
+            os.makedirs(self.users_dir, exist_ok=True)
+            self._migrate_legacy_user_stats()
         
         if not os.path.exists(self.achievements_file):
-            with open(self.achievements_file, 'w') as f:
-                json.dump(self._get_default_achievements(), f, indent=2)
+            _atomic_write(self.achievements_file, _json_dumps(self._get_default_achievements()))
+        
+        if not os.path.isdir(self.goals_dir):
+            os.makedirs(self.goals_dir, exist_ok=True)
+            self._migrate_legacy_goals()
+    
+    def _user_sessions_path(self, user_id: str) -> str:
+        """Path of the JSONL shard holding one user's sessions"""
+        return os.path.join(self.sessions_dir, f'{_safe_filename(user_id)}.jsonl')
+    
+    def _migrate_legacy_sessions(self):
+        """Split the old combined sessions files into per-user shards"""
+        by_user = defaultdict(list)
+        for legacy_file in self.legacy_sessions_files:
+            if not os.path.exists(legacy_file):
+                continue
+            
+            try:
+                with open(legacy_file, 'rb') as f:
+                    if legacy_file.endswith('.jsonl'):
+                        sessions = [_json_loads(line) for line in f if line.strip()]
+                    else:
+                        sessions = _json_loads(f.read())
+            except json.JSONDecodeError:
+                sessions = []
+            
+            for session in sessions:
+                # Older writers stored datetimes via str(); make them sortable against isoformat()
+                completed_at = session.get('completedAt')
+                if isinstance(completed_at, str) and completed_at[10:11] == ' ':
+                    session['completedAt'] = completed_at.replace(' ', 'T', 1)
+                by_user[session.get('userId', 'anonymous')].append(session)
+            
+            os.replace(legacy_file, legacy_file + '.migrated')
+            self.logger.info(f"Migrated {len(sessions)} sessions from {legacy_file}")
         
-        if not os.path.exists(self.goals_file):
-            with open(self.goals_file, 'w') as f:
-                json.dump({}, f)
+        with _sessions_lock:
+            for user_id, sessions in by_user.items():
+                # Shards are kept in completion order from here on
+                sessions.sort(key=_completed_epoch)
+                self._save_sessions(user_id, sessions)
     
-    def _load_sessions(self) -> List[Dict]:
-        """Load all typing sessions"""
+    def _read_shard(self, path: str) -> List[Dict]:
+        """Read one JSONL shard, skipping a torn trailing line; unchanged shards come from memory"""
+        sessions = []
         try:
-            with open(self.sessions_file, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return []
+            with open(path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                version = (st.st_ino, st.st_mtime_ns, st.st_size)
+                with _shard_cache_lock:
+                    cached = _shard_cache.get(path)
+                    if cached is not None and cached[0] == version:
+                        _shard_cache.move_to_end(path)
+                        # Callers may reorder or slice the list, but not edit the records
+                        return list(cached[1])
+                
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        sessions.append(_json_loads(line))
+                    except json.JSONDecodeError:
+                        # A torn trailing line from an interrupted append
+                        continue
+        except FileNotFoundError:
+            return sessions
+        
+        # Stat'd before reading, so a concurrent append only makes this entry stale
+        with _shard_cache_lock:
+            _shard_cache[path] = (version, sessions)
+            _shard_cache.move_to_end(path)
+            if len(_shard_cache) > SHARD_CACHE_MAXSIZE:
+                _shard_cache.popitem(last=False)
+        return list(sessions)
+    
+    def _load_sessions(self, user_id: Optional[str] = None) -> List[Dict]:
+        """Load one user's typing sessions, or every user's when no id is given"""
+        if user_id is not None:
+            return self._read_shard(self._user_sessions_path(user_id))
+        
+        sessions = []
+        for name in sorted(os.listdir(self.sessions_dir)):
+            if name.endswith('.jsonl'):
+                sessions.extend(self._read_shard(os.path.join(self.sessions_dir, name)))
+        return sessions
+    
+    def _save_sessions(self, user_id: str, sessions: List[Dict]):
+        """Replace one user's typing sessions; caller holds _sessions_lock"""
+        path = self._user_sessions_path(user_id)
+        _atomic_write(path, b''.join(_json_dumps(session) + b'\n' for session in sessions))
+        # The open append descriptor still points at the replaced file
+        _session_appender.close(path)
+    
+    def _delete_sessions(self, user_id: str):
+        """Remove all of one user's typing sessions"""
+        path = self._user_sessions_path(user_id)
+        with _sessions_lock:
+            _session_appender.close(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    
+    async def _append_session(self, session_dict: Dict):
+        """Append one session to its user's shard"""
+        path = self._user_sessions_path(session_dict.get('userId', 'anonymous'))
+        line = _json_dumps(session_dict) + b'\n'
+        await asyncio.wrap_future(_session_appender.submit(path, line))
     
-    def _save_sessions(self, sessions: List[Dict]):
-        """Save typing sessions"""
-        with open(self.sessions_file, 'w') as f:
-            json.dump(sessions, f, indent=2, default=str)
+    def _recent_sessions(self, user_id: str, count: int, offset: int = 0) -> List[Dict]:
+        """A user's sessions newest first by server-stamped epoch, skipping the first offset"""
+        sessions = self._load_sessions(user_id)
+        # Epochs have one-second resolution; shard position orders saves within a second
+        newest = heapq.nlargest(offset + count, enumerate(sessions),
+                                key=lambda item: (_completed_epoch(item[1]), item[0]))
+        return [session for _, session in newest[offset:]]
     
-    def _load_user_stats(self) -> Dict:
-        """Load all user stats"""
+    def _maybe_prune_sessions(self, user_id: str, total_sessions: int):
+        """Trim a user's shard in the background once they pass the cap, every PRUNE_EVERY sessions"""
+        if total_sessions > self.MAX_SESSIONS_PER_USER and total_sessions % self.PRUNE_EVERY == 0:
+            threading.Thread(target=self._compact_sessions, args=(user_id,),
+                             name='sessions-compaction', daemon=True).start()
+    
+    def _compact_sessions(self, user_id: str):
+        """Rewrite a user's shard keeping only their most recent sessions"""
         try:
-            with open(self.users_file, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
+            with _sessions_lock, open(self._user_sessions_path(user_id), 'rb') as shard:
+                # Held until the replacement is in place; appenders then reopen the new file
+                if FCNTL_AVAILABLE:
+                    fcntl.flock(shard.fileno(), fcntl.LOCK_EX)
+                
+                # Keep the newest sessions by server-stamped epoch; the stable sort keeps
+                # save order among sessions stamped in the same second
+                sessions = self._load_sessions(user_id)
+                if len(sessions) > self.MAX_SESSIONS_PER_USER:
+                    sessions.sort(key=_completed_epoch)
+                    self._save_sessions(user_id, sessions[-self.MAX_SESSIONS_PER_USER:])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.error(f"Error compacting sessions for {user_id}: {e}")
+    
+    def _user_stats_path(self, user_id: str) -> str:
+        """Path of the file holding one user's stats"""
+        return os.path.abspath(os.path.join(self.users_dir, f'{_safe_filename(user_id)}.json'))
+    
+    def _migrate_legacy_user_stats(self):
+        """Split the old combined user stats file into per-user files"""
+        if not os.path.exists(self.legacy_users_file):
+            return
+        
+        try:
+            with open(self.legacy_users_file, 'rb') as f:
+                users = _json_loads(f.read())
+        except json.JSONDecodeError:
+            users = {}
+        
+        for user_id, user_dict in users.items():
+            _atomic_write(self._user_stats_path(user_id), _json_dumps(user_dict))
+        
+        os.replace(self.legacy_users_file, self.legacy_users_file + '.migrated')
+        self.logger.info(f"Migrated stats for {len(users)} users")
     
-    def _save_user_stats(self, users: Dict):
-        """Save user stats"""
-        with open(self.users_file, 'w') as f:
-            json.dump(users, f, indent=2, default=str)
+    def _get_user(self, user_id: str) -> Optional[Dict]:
+        """Get a copy of a user's stats from the cache, loading them from disk on a miss"""
+        return _get_record(self._user_stats_path(user_id))
+    
+    def _put_user(self, user_id: str, user_dict: Dict):
+        """Cache a user's stats and schedule them for writing"""
+        _put_record(self._user_stats_path(user_id), user_dict)
+    
+    def _delete_user(self, user_id: str):
+        """Drop a user's stats from the cache and disk"""
+        _delete_record(self._user_stats_path(user_id))
+    
+    async def flush(self):
+        """Write all pending user stats and goals now, e.g. before shutdown"""
+        await asyncio.to_thread(_flush_records)
     
     def _load_achievements(self) -> List[Dict]:
         """Load achievements"""
         try:
-            with open(self.achievements_file, 'r') as f:
-                return json.load(f)
+            with open(self.achievements_file, 'rb') as f:
+                return _json_loads(f.read())
         except (json.JSONDecodeError, FileNotFoundError):
-            return self._get_default_achievements()
+            return list(self._get_default_achievements())
+    
+    def _user_goals_path(self, user_id: str) -> str:
+        """Path of the file holding one user's goals"""
+        return os.path.abspath(os.path.join(self.goals_dir, f'{_safe_filename(user_id)}.json'))
     
-    def _load_goals(self) -> Dict:
-        """Load user goals"""
+    def _migrate_legacy_goals(self):
+        """Split the old combined goals file into per-user files"""
+        if not os.path.exists(self.legacy_goals_file):
+            return
+        
         try:
-            with open(self.goals_file, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
+            with open(self.legacy_goals_file, 'rb') as f:
+                goals = _json_loads(f.read())
+        except json.JSONDecodeError:
+            goals = {}
+        
+        for user_id, user_goals in goals.items():
+            _atomic_write(self._user_goals_path(user_id), _json_dumps({'userId': user_id, 'goals': user_goals}))
+        
+        os.replace(self.legacy_goals_file, self.legacy_goals_file + '.migrated')
+        self.logger.info(f"Migrated goals for {len(goals)} users")
     
-    def _save_goals(self, goals: Dict):
-        """Save user goals"""
-        with open(self.goals_file, 'w') as f:
-            json.dump(goals, f, indent=2, default=str)
+    def _load_goals(self, user_id: str) -> List[Dict]:
+        """Load one user's goals; callers that modify them must pass them to _save_goals"""
+        record = _get_record(self._user_goals_path(user_id))
+        return record['goals'] if record is not None else []
+    
+    def _save_goals(self, user_id: str, goals: List[Dict]):
+        """Save one user's goals in the background"""
+        _put_record(self._user_goals_path(user_id), {'userId': user_id, 'goals': goals})
+    
+    def _delete_goals(self, user_id: str):
+        """Drop a user's goals from the cache and disk"""
+        _delete_record(self._user_goals_path(user_id))
     
     async def save_typing_session(self, session_data: Dict) -> Dict:
         """Save typing session with enhanced analytics"""
@@ -122,25 +744,19 @@ class EnhancedAnalyticsService:
             else:
                 session_dict = self._create_session_dict(session_data)
             
-            # Load existing sessions
-            sessions = self._load_sessions()
-            sessions.append(session_dict)
-            
-            # Keep only last 1000 sessions per user to manage file size
+            # Append to the session log; per-user caps are enforced by periodic pruning.
+            # The epoch comes from the server clock so shards stay ordered even when the
+            # client's completedAt is skewed or the save is retried later
             user_id = session_dict.get('userId', 'anonymous')
-            user_sessions = [s for s in sessions if s.get('userId') == user_id]
-            if len(user_sessions) > 1000:
-                sessions = [s for s in sessions if s.get('userId') != user_id]
-                sessions.extend(sorted(user_sessions, key=lambda x: x.get('completedAt', ''))[-1000:])
-            
-            # Save sessions
-            self._save_sessions(sessions)
+            session_dict['completedAtEpoch'] = int(time.time())
+            await self._append_session(session_dict)
             
             # Update user statistics
-            await self.update_user_stats(user_id, session_data)
+            user_dict = await self.update_user_stats(user_id, session_data)
+            self._maybe_prune_sessions(user_id, user_dict.get('totalSessions', 0))
             
-            # Check for achievements
-            new_achievements = await self.check_achievements(user_id, session_data)
+            # Check for achievements against the stats just updated
+            new_achievements = await self.check_achievements(user_id, session_data, user_dict)
             
             self.logger.info(f"Session saved: {session_dict.get('sessionId', 'unknown')}")
             
@@ -157,6 +773,7 @@ class EnhancedAnalyticsService:
     
     def _create_session_dict(self, session_data: Dict) -> Dict:
         """Create session dictionary when models are not available"""
+        now_iso = datetime.now().isoformat()
         return {
             'sessionId': str(uuid.uuid4()),
             'userId': session_data.get('userId', 'anonymous'),
@@ -165,23 +782,21 @@ class EnhancedAnalyticsService:
             'duration': session_data['duration'],
             'sessionType': session_data.get('sessionType', 'practice'),
             'contentType': session_data.get('contentType', 'custom'),
-            'completedAt': datetime.now().isoformat(),
-            'createdAt': datetime.now().isoformat()
+            'completedAt': now_iso,
+            'createdAt': now_iso
         }
     
     async def update_user_stats(self, user_id: str, session_data: Dict):
         """Update comprehensive user statistics"""
         try:
-            users = self._load_user_stats()
+            user_dict = await asyncio.to_thread(self._get_user, user_id)
             
-            if user_id not in users:
+            if user_dict is None:
                 if MODELS_AVAILABLE:
                     user_stats = UserStats(user_id)
                     user_dict = user_stats.to_dict()
                 else:
                     user_dict = self._create_user_stats_dict(user_id)
-            else:
-                user_dict = users[user_id]
             
             # Update session count and time
             user_dict['totalSessions'] = user_dict.get('totalSessions', 0) + 1
@@ -210,8 +825,7 @@ class EnhancedAnalyticsService:
             await self._update_goals_progress(user_id, user_dict, session_data)
             
             # Save updated stats
-            users[user_id] = user_dict
-            self._save_user_stats(users)
+            self._put_user(user_id, user_dict)
             
             return user_dict
             
@@ -221,6 +835,7 @@ class EnhancedAnalyticsService:
     
     def _create_user_stats_dict(self, user_id: str) -> Dict:
         """Create user stats dictionary when models are not available"""
+        now_iso = datetime.now().isoformat()
         return {
             'userId': user_id,
             'totalSessions': 0,
@@ -234,8 +849,8 @@ class EnhancedAnalyticsService:
             'lastPracticeDate': None,
             'achievements': [],
             'goals': [],
-            'createdAt': datetime.now().isoformat(),
-            'updatedAt': datetime.now().isoformat()
+            'createdAt': now_iso,
+            'updatedAt': now_iso
         }
     
     def _update_streak(self, user_dict: Dict):
@@ -271,8 +886,10 @@ class EnhancedAnalyticsService:
     async def _update_goals_progress(self, user_id: str, user_dict: Dict, session_data: Dict):
         """Update goals progress"""
         try:
-            goals_data = self._load_goals()
-            user_goals = goals_data.get(user_id, [])
+            user_goals = await asyncio.to_thread(self._load_goals, user_id)
+            now = datetime.now()
+            now_iso = now.isoformat()
+            changed = False
             
             for goal in user_goals:
                 if goal.get('status') != 'active':
@@ -291,7 +908,8 @@ class EnhancedAnalyticsService:
                     continue
                 
                 goal['currentValue'] = new_value
-                goal['updatedAt'] = datetime.now().isoformat()
+                goal['updatedAt'] = now_iso
+                changed = True
                 
                 # Calculate progress
                 target_value = goal.get('targetValue', 1)
@@ -301,66 +919,63 @@ class EnhancedAnalyticsService:
                 # Check completion
                 if new_value >= target_value and goal.get('status') == 'active':
                     goal['status'] = 'completed'
-                    goal['completedAt'] = datetime.now().isoformat()
+                    goal['completedAt'] = now_iso
                 
                 # Check expiration
                 deadline = goal.get('deadline')
                 if deadline:
                     deadline_dt = datetime.fromisoformat(deadline)
-                    if datetime.now() > deadline_dt and goal.get('status') == 'active':
+                    if now > deadline_dt and goal.get('status') == 'active':
                         goal['status'] = 'expired'
             
-            goals_data[user_id] = user_goals
-            self._save_goals(goals_data)
+            # Most saves touch no active goal; skip rewriting the goals file for them
+            if changed:
+                await asyncio.to_thread(self._save_goals, user_id, user_goals)
             
         except Exception as e:
             self.logger.error(f"Error updating goals: {e}")
     
-    async def check_achievements(self, user_id: str, session_data: Dict) -> List[Dict]:
+    async def check_achievements(self, user_id: str, session_data: Dict, user_dict: Optional[Dict] = None) -> List[Dict]:
         """Check for new achievements"""
         try:
-            users = self._load_user_stats()
-            if user_id not in users:
-                return []
+            if user_dict is None:
+                user_dict = await asyncio.to_thread(self._get_user, user_id)
+                if user_dict is None:
+                    return []
             
-            user_dict = users[user_id]
             earned_ids = {ach.get('id') for ach in user_dict.get('achievements', [])}
             
             new_achievements = []
-            available_achievements = self._get_available_achievements()
+            now_iso = datetime.now().isoformat()
+            current_values = {
+                'speed': session_data['wpm'],
+                'accuracy': session_data['accuracy'],
+                'streak': user_dict.get('currentStreak', 0),
+                'milestone': user_dict.get('totalSessions', 0)
+            }
             
-            for achievement in available_achievements:
-                if achievement['id'] in earned_ids:
-                    continue
-                
-                earned = False
-                category = achievement.get('category', '')
-                criteria = achievement.get('criteria', {})
-                
-                if category == 'speed':
-                    earned = session_data['wpm'] >= criteria.get('minWpm', 0)
-                elif category == 'accuracy':
-                    earned = session_data['accuracy'] >= criteria.get('minAccuracy', 0)
-                elif category == 'streak':
-                    earned = user_dict.get('currentStreak', 0) >= criteria.get('days', 0)
-                elif category == 'milestone':
-                    earned = user_dict.get('totalSessions', 0) >= criteria.get('sessionCount', 0)
-                
-                if earned:
+            for category, ladder in self._get_achievements_by_category().items():
+                value = current_values[category]
+                # Thresholds ascend, so the first unmet one ends the category
+                for threshold, achievement in ladder:
+                    if value < threshold:
+                        break
+                    if achievement['id'] in earned_ids:
+                        continue
+                    
                     new_achievement = {
                         'id': achievement['id'],
                         'title': achievement['title'],
                         'description': achievement['description'],
                         'category': achievement['category'],
-                        'earnedAt': datetime.now().isoformat(),
-                        'progressValue': session_data.get('wpm', session_data.get('accuracy', user_dict.get('currentStreak', 0)))
+                        'earnedAt': now_iso,
+                        'progressValue': value
                     }
                     new_achievements.append(new_achievement)
                     user_dict.setdefault('achievements', []).append(new_achievement)
             
             if new_achievements:
-                users[user_id] = user_dict
-                self._save_user_stats(users)
+                self._put_user(user_id, user_dict)
             
             return new_achievements
             
@@ -368,144 +983,49 @@ class EnhancedAnalyticsService:
             self.logger.error(f"Error checking achievements: {e}")
             return []
     
-    def _get_available_achievements(self) -> List[Dict]:
+    def _get_achievements_by_category(self) -> Dict[str, List[Tuple[float, Dict]]]:
+        """Available achievements grouped by category, sorted by threshold"""
+        global _achievements_by_category
+        if _achievements_by_category is None:
+            by_category = defaultdict(list)
+            for achievement in self._get_available_achievements():
+                criteria_key = _CATEGORY_CRITERIA.get(achievement.get('category'))
+                if criteria_key is None:
+                    continue
+                # Model-built achievements carry their threshold as targetValue instead of criteria
+                threshold = (achievement.get('criteria') or {}).get(criteria_key, achievement.get('targetValue', 0))
+                by_category[achievement['category']].append((threshold, achievement))
+            _achievements_by_category = {
+                category: sorted(ladder, key=lambda item: item[0])
+                for category, ladder in by_category.items()
+            }
+        return _achievements_by_category
+    
+    def _get_available_achievements(self) -> Tuple[Dict, ...]:
         """Get list of available achievements"""
-        if MODELS_AVAILABLE:
-            try:
-                return [ach.to_dict() for ach in Achievement.get_default_achievements()]
-            except:
-                pass
-        
-        return self._get_default_achievements()
+        global _available_achievements
+        if _available_achievements is None:
+            achievements = None
+            if MODELS_AVAILABLE:
+                try:
+                    achievements = [ach.to_dict() for ach in Achievement.get_default_achievements()]
+                except:
+                    pass
+            
+            _available_achievements = tuple(achievements or self._get_default_achievements())
+        return _available_achievements
     
-    def _get_default_achievements(self) -> List[Dict]:
+    def _get_default_achievements(self) -> Tuple[Dict, ...]:
         """Get default achievements as dictionaries"""
-        return [
-            # Speed achievements
-            {
-                'id': 'speed_20',
-                'title': 'Speed Novice',
-                'description': 'Reach 20 WPM',
-                'category': 'speed',
-                'criteria': {'minWpm': 20},
-                'icon': '🐢',
-                'points': 10
-            },
-            {
-                'id': 'speed_40',
-                'title': 'Speed Apprentice',
-                'description': 'Reach 40 WPM',
-                'category': 'speed',
-                'criteria': {'minWpm': 40},
-                'icon': '🏃',
-                'points': 20
-            },
-            {
-                'id': 'speed_60',
-                'title': 'Speed Expert',
-                'description': 'Reach 60 WPM',
-                'category': 'speed',
-                'criteria': {'minWpm': 60},
-                'icon': '⚡',
-                'points': 50
-            },
-            {
-                'id': 'speed_80',
-                'title': 'Speed Demon',
-                'description': 'Reach 80 WPM',
-                'category': 'speed',
-                'criteria': {'minWpm': 80},
-                'icon': '🔥',
-                'points': 100
-            },
-            
-            # Accuracy achievements
-            {
-                'id': 'accuracy_90',
-                'title': 'Precision Rookie',
-                'description': 'Achieve 90% accuracy',
-                'category': 'accuracy',
-                'criteria': {'minAccuracy': 90},
-                'icon': '🎯',
-                'points': 15
-            },
-            {
-                'id': 'accuracy_95',
-                'title': 'Accuracy Expert',
-                'description': 'Achieve 95% accuracy',
-                'category': 'accuracy',
-                'criteria': {'minAccuracy': 95},
-                'icon': '💎',
-                'points': 30
-            },
-            {
-                'id': 'accuracy_99',
-                'title': 'Near Perfect',
-                'description': 'Achieve 99% accuracy',
-                'category': 'accuracy',
-                'criteria': {'minAccuracy': 99},
-                'icon': '🌟',
-                'points': 75
-            },
-            
-            # Streak achievements
-            {
-                'id': 'streak_3',
-                'title': 'Getting Started',
-                'description': 'Practice 3 days in a row',
-                'category': 'streak',
-                'criteria': {'days': 3},
-                'icon': '📅',
-                'points': 20
-            },
-            {
-                'id': 'streak_7',
-                'title': 'Week Warrior',
-                'description': 'Practice 7 days in a row',
-                'category': 'streak',
-                'criteria': {'days': 7},
-                'icon': '🗓️',
-                'points': 50
-            },
-            
-            # Milestone achievements
-            {
-                'id': 'milestone_1',
-                'title': 'First Steps',
-                'description': 'Complete your first session',
-                'category': 'milestone',
-                'criteria': {'sessionCount': 1},
-                'icon': '🎉',
-                'points': 5
-            },
-            {
-                'id': 'milestone_10',
-                'title': 'Dedicated Learner',
-                'description': 'Complete 10 sessions',
-                'category': 'milestone',
-                'criteria': {'sessionCount': 10},
-                'icon': '📚',
-                'points': 25
-            },
-            {
-                'id': 'milestone_50',
-                'title': 'Typing Enthusiast',
-                'description': 'Complete 50 sessions',
-                'category': 'milestone',
-                'criteria': {'sessionCount': 50},
-                'icon': '🏅',
-                'points': 100
-            }
-        ]
+        return _DEFAULT_ACHIEVEMENTS
     
     async def generate_recommendations(self, user_id: str) -> List[Dict]:
         """Generate personalized recommendations"""
         try:
-            users = self._load_user_stats()
-            if user_id not in users:
+            user_dict = await asyncio.to_thread(self._get_user, user_id)
+            if user_dict is None:
                 return []
             
-            user_dict = users[user_id]
             recommendations = []
             
             # Speed recommendations
@@ -555,18 +1075,15 @@ class EnhancedAnalyticsService:
     async def get_detailed_analytics(self, user_id: str, time_range: str = 'week') -> Dict:
         """Get comprehensive analytics data"""
         try:
-            users = self._load_user_stats()
-            sessions = self._load_sessions()
-            
-            user_dict = users.get(user_id, self._create_user_stats_dict(user_id))
-            
-            # Filter sessions by time range
-            cutoff_date = self._get_cutoff_date(time_range)
-            user_sessions = [
-                s for s in sessions 
-                if s.get('userId') == user_id and 
-                datetime.fromisoformat(s.get('completedAt', '2020-01-01')) >= cutoff_date
-            ]
+            sessions, user_dict = await asyncio.gather(
+                asyncio.to_thread(self._load_sessions, user_id),
+                asyncio.to_thread(self._get_user, user_id)
+            )
+            user_dict = user_dict or self._create_user_stats_dict(user_id)
+            
+            # Filter sessions by time range; shards are appended in server-stamped epoch order
+            cutoff_epoch = int(self._get_cutoff_date(time_range).timestamp())
+            user_sessions = _sessions_since(sessions, cutoff_epoch)
             
             # Generate analytics
             recommendations = await self.generate_recommendations(user_id)
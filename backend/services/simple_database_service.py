@@ -5,6 +5,9 @@ import json
 import uuid
 from typing import Dict
 
+# Display names for the session types the app writes, so formatting avoids .title() per row
+_TITLE_CACHE = {ct: ct.title() for ct in ('practice', 'test', 'custom', 'pdf')}
+
 class SimpleSupabaseService:
     def __init__(self):
         self.url = os.environ.get('SUPABASE_URL')
@@ -113,18 +116,16 @@ class SimpleSupabaseService:
                     
                     recent_sessions = []
                     if sessions_response.status_code == 200:
-                        sessions_data = sessions_response.json()
-                        for session in sessions_data:
-                            duration = session['duration_seconds']
-                            minutes = int(duration // 60)
-                            seconds = int(duration % 60)
-                            recent_sessions.append({
+                        recent_sessions = [
+                            {
                                 'date': session['created_at'][:10],
-                                'duration': f"{minutes}m {seconds}s",
+                                'duration': '%dm %ds' % divmod(int(session['duration_seconds']), 60),
                                 'wpm': session['wpm'],
                                 'accuracy': session['accuracy'],
-                                'mode': session['session_type'].title()
-                            })
+                                'mode': _TITLE_CACHE.get(session['session_type']) or session['session_type'].title()
+                            }
+                            for session in sessions_response.json()
+                        ]
                     
                     return {
                         'averageWpm': int(stats.get('avg_wpm', 0)),
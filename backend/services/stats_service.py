@@ -9,6 +9,23 @@ import os
 import math
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def _json_dumps(obj) -> bytes:
+    """Encode the stats file, with orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def _json_loads(data: bytes):
+    """Decode the stats file"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
 
 class StatsService:
     """Service for handling user statistics"""
@@ -45,8 +62,8 @@ class StatsService:
     def _read_stats(self) -> Dict:
         """Read stats from file with error handling"""
         try:
-            with open(self.stats_file, 'r', encoding='utf-8') as f:
-                stats = json.load(f)
+            with open(self.stats_file, 'rb') as f:
+                stats = _json_loads(f.read())
                 
             # Ensure all required fields exist
             defaults = {
@@ -84,8 +101,13 @@ class StatsService:
     def _write_stats(self, stats: Dict):
         """Write stats to file with error handling"""
         try:
-            with open(self.stats_file, 'w', encoding='utf-8') as f:
-                json.dump(stats, f, indent=2, ensure_ascii=False)
+            # Write aside and rename so a crash never leaves a truncated stats file
+            tmp_file = f'{self.stats_file}.{os.getpid()}.tmp'
+            with open(tmp_file, 'wb') as f:
+                f.write(_json_dumps(stats))
+                f.flush()
+                getattr(os, 'fdatasync', os.fsync)(f.fileno())
+            os.replace(tmp_file, self.stats_file)
         except Exception as e:
             raise Exception(f"Failed to write stats: {e}")
     
@@ -93,6 +115,16 @@ class StatsService:
         """Get current user statistics"""
         return self._read_stats()
     
+    def get_debug_info(self) -> Dict:
+        """Get basic information about the stats file for debugging"""
+        exists = os.path.exists(self.stats_file)
+        return {
+            'stats_file': self.stats_file,
+            'file_exists': exists,
+            'file_size': os.path.getsize(self.stats_file) if exists else 0,
+            'last_modified': datetime.fromtimestamp(os.path.getmtime(self.stats_file)).isoformat() if exists else None
+        }
+    
     def save_session(self, session_data: Dict) -> Dict:
         """Save a typing session and update statistics"""
         try:
@@ -2,12 +2,12 @@ from .logging_config import setup_logging, get_logger
 from .error_handlers import register_error_handlers
 from .validators import FileValidator, validate_pdf_upload, validate_stats_data
 from .decorators import handle_errors, rate_limit
-from .cache import pdf_cache, cache_pdf_extraction
+from .cache import pdf_cache, cache_pdf_extraction, TTLCache
 from .text_processor import TextProcessor
 
 __all__ = [
     'setup_logging', 'get_logger', 'register_error_handlers',
     'FileValidator', 'validate_pdf_upload', 'validate_stats_data',
     'handle_errors', 'rate_limit', 'pdf_cache', 'cache_pdf_extraction',
-    'TextProcessor'
+    'TTLCache', 'TextProcessor'
 ]
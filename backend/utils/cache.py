@@ -1,7 +1,27 @@
 import os
 import json
+import time
 import hashlib
+import threading
+from collections import OrderedDict
 from functools import wraps
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def _json_dumps(obj) -> bytes:
+    """Encode a cache entry, with orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def _json_loads(data: bytes):
+    """Decode a cache entry"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
 
 class SimpleFileCache:
     """Simple file-based cache for PDF processing"""
@@ -27,8 +47,8 @@ class SimpleFileCache:
         cache_file = os.path.join(self.cache_dir, f"{key}.json")
         try:
             if os.path.exists(cache_file):
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                with open(cache_file, 'rb') as f:
+                    return _json_loads(f.read())
         except (json.JSONDecodeError, IOError):
             # Remove corrupted cache file
             try:
@@ -44,8 +64,8 @@ class SimpleFileCache:
         
         cache_file = os.path.join(self.cache_dir, f"{key}.json")
         try:
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            with open(cache_file, 'wb') as f:
+                f.write(_json_dumps(data))
         except (IOError, TypeError):
             pass  # Fail silently if caching fails
     
@@ -58,6 +78,55 @@ class SimpleFileCache:
         except OSError:
             pass
 
+class TTLCache:
+    """Thread-safe in-memory LRU cache with per-entry expiry"""
+    
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        """Get cached value if present and not expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value, ttl=None):
+        """Set cached value, evicting least recently used entries past maxsize"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def delete(self, key):
+        """Remove a cached value"""
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        """Clear all cached values"""
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self):
+        return len(self._data)
+
 # Global cache instance
 pdf_cache = SimpleFileCache()
 
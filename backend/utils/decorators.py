@@ -1,10 +1,14 @@
 from functools import wraps
 from flask import request, jsonify, current_app
 import time
-from collections import defaultdict
+import threading
+from .cache import TTLCache
 
-# Rate limiter storage
-rate_limiter_storage = defaultdict(list)
+# Rate limiter storage: (endpoint, client_ip) -> (tokens, last_refill). A bucket left
+# alone for a whole window has fully refilled, so it expires and clients don't pile up
+RATE_LIMITER_MAXSIZE = 100000
+rate_limiter_storage = TTLCache(maxsize=RATE_LIMITER_MAXSIZE)
+rate_limiter_lock = threading.Lock()
 
 def handle_errors(f):
     """Decorator to handle common errors"""
@@ -40,21 +44,20 @@ def rate_limit(max_requests=None, time_window=None):
             window = time_window or current_app.config.get('RATE_LIMIT_WINDOW', 60)
             
             client_ip = request.environ.get('HTTP_X_REAL_IP', request.remote_addr)
-            now = time.time()
+            key = (request.endpoint, client_ip)
+            refill_rate = max_reqs / window
+            now = time.monotonic()
             
-            # Clean old requests
-            rate_limiter_storage[client_ip] = [
-                req_time for req_time in rate_limiter_storage[client_ip]
-                if now - req_time < window
-            ]
+            # Token bucket: refill for the elapsed time, then spend one token
+            with rate_limiter_lock:
+                tokens, last_refill = rate_limiter_storage.get(key, (max_reqs, now))
+                tokens = min(max_reqs, tokens + (now - last_refill) * refill_rate)
+                allowed = tokens >= 1
+                rate_limiter_storage.set(key, (tokens - 1 if allowed else tokens, now), ttl=window)
             
-            # Check if under limit
-            if len(rate_limiter_storage[client_ip]) >= max_reqs:
+            if not allowed:
                 return jsonify({'error': 'Rate limit exceeded'}), 429
             
-            # Add current request
-            rate_limiter_storage[client_ip].append(now)
-            
             return f(*args, **kwargs)
         return decorated_function
     return decorator
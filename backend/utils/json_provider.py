@@ -0,0 +1,44 @@
+# backend/utils/json_provider.py
+"""
+orjson-backed JSON provider for Flask
+Used for request.get_json() parsing and jsonify() responses
+"""
+
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that parses and serializes with orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        """Serialize obj to a JSON string, deferring to stdlib json for unsupported options"""
+        options = dict(kwargs)
+        indent = options.pop('indent', None)
+        sort_keys = options.pop('sort_keys', self.sort_keys)
+        default = options.pop('default', self.default)
+        options.pop('ensure_ascii', None)
+        # Flask's response() asks for the compact pair outside debug mode, which is orjson's output
+        separators = options.pop('separators', None)
+        
+        if options or indent not in (None, 2) or separators not in (None, (',', ':')) \
+                or (separators and indent):
+            return super().dumps(obj, **kwargs)
+        
+        # Datetimes go through Flask's default so they keep the HTTP date format
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        
+        try:
+            return orjson.dumps(obj, default=default, option=option).decode('utf-8')
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits
+            return super().dumps(obj, **kwargs)
+    
+    def loads(self, s, **kwargs):
+        """Deserialize JSON from str or bytes"""
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
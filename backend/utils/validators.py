@@ -4,8 +4,13 @@ try:
     MAGIC_AVAILABLE = True
 except ImportError:
     MAGIC_AVAILABLE = False
+try:
+    import msgspec
+    MSGSPEC_AVAILABLE = True
+except ImportError:
+    MSGSPEC_AVAILABLE = False
 from werkzeug.utils import secure_filename
-from typing import Dict, List, Any
+from typing import Annotated, Dict, List, Any, Optional
 
 class FileValidator:
     ALLOWED_EXTENSIONS = {'pdf'}
@@ -77,6 +82,26 @@ def validate_pdf_upload(request):
     file = request.files['file']
     return FileValidator.validate_file_upload(file)
 
+if MSGSPEC_AVAILABLE:
+    class StatsData(msgspec.Struct):
+        """Typed schema for the required /save-stats fields"""
+        wpm: Annotated[float, msgspec.Meta(ge=0)]
+        accuracy: Annotated[float, msgspec.Meta(ge=0, le=100)]
+        duration: Annotated[float, msgspec.Meta(gt=0)]
+
+def fast_validate_stats_data(raw: bytes) -> Optional[Dict]:
+    """Decode and type-check a stats payload in C, or None if the full validator is needed"""
+    if not MSGSPEC_AVAILABLE or not raw:
+        return None
+    
+    try:
+        data = msgspec.json.decode(raw)
+        msgspec.convert(data, type=StatsData, strict=False)
+    except (msgspec.DecodeError, msgspec.ValidationError):
+        return None
+    
+    return data
+
 def validate_stats_data(data):
     """Enhanced validation for statistics data with detailed error reporting"""
     required_fields = ['wpm', 'accuracy', 'duration']
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+TypeTutor bcrypt cost benchmark
+Measures ms per hash for a range of costs so BCRYPT_COST can be tuned
+to the target (~250ms per hash) on the machine that will run the backend
+"""
+
+import sys
+import time
+import argparse
+
+try:
+    import bcrypt
+except ImportError:
+    print("❌ bcrypt module not found!")
+    print("⚠️ Please run: pip install bcrypt")
+    sys.exit(1)
+
+def time_hash(cost: int, iterations: int) -> float:
+    """Average milliseconds per bcrypt hash at the given cost"""
+    password = ('x' * 16).encode('utf-8')
+    start = time.perf_counter()
+    for _ in range(iterations):
+        bcrypt.hashpw(password, bcrypt.gensalt(rounds=cost))
+    return (time.perf_counter() - start) * 1000 / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark bcrypt costs for BCRYPT_COST tuning')
+    parser.add_argument('--min-cost', type=int, default=10)
+    parser.add_argument('--max-cost', type=int, default=14)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--target-ms', type=float, default=250.0)
+    args = parser.parse_args()
+    
+    recommended = None
+    for cost in range(args.min_cost, args.max_cost + 1):
+        ms = time_hash(cost, args.iterations)
+        print(f"cost={cost:2d}  {ms:8.1f} ms/hash")
+        if recommended is None and ms >= args.target_ms:
+            recommended = cost
+    
+    if recommended is None:
+        print(f"⚠️ No cost up to {args.max_cost} reached {args.target_ms:.0f}ms - try a higher --max-cost")
+    else:
+        print(f"✅ Recommended BCRYPT_COST={recommended}")
+
+if __name__ == "__main__":
+    main()
@@ -43,6 +43,7 @@ ALTER TABLE user_statistics ENABLE ROW LEVEL SECURITY;
 ALTER TABLE user_achievements ENABLE ROW LEVEL SECURITY;
 ALTER TABLE goals ENABLE ROW LEVEL SECURITY;
 ALTER TABLE pdf_documents ENABLE ROW LEVEL SECURITY;
+ALTER TABLE user_dashboard_cache ENABLE ROW LEVEL SECURITY;
 
 -- Basic RLS policies (allow all for now - can be tightened later)
 CREATE POLICY IF NOT EXISTS "Allow all access to users" ON users FOR ALL USING (true);
@@ -51,6 +52,7 @@ CREATE POLICY IF NOT EXISTS "Allow all access to user_statistics" ON user_statis
 CREATE POLICY IF NOT EXISTS "Allow all access to user_achievements" ON user_achievements FOR ALL USING (true);
 CREATE POLICY IF NOT EXISTS "Allow all access to goals" ON goals FOR ALL USING (true);
 CREATE POLICY IF NOT EXISTS "Allow all access to pdf_documents" ON pdf_documents FOR ALL USING (true);
+CREATE POLICY IF NOT EXISTS "Allow all access to user_dashboard_cache" ON user_dashboard_cache FOR ALL USING (true);
 
 -- Allow read access to achievements for all users
 CREATE POLICY IF NOT EXISTS "Allow read access to achievements" ON achievements FOR SELECT USING (true);
@@ -65,13 +67,16 @@ END;
 $ language 'plpgsql';
 
 -- Triggers for automatic timestamp updates
-CREATE TRIGGER IF NOT EXISTS update_users_updated_at BEFORE UPDATE ON users
+DROP TRIGGER IF EXISTS update_users_updated_at ON users;
+CREATE TRIGGER update_users_updated_at BEFORE UPDATE ON users
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
-CREATE TRIGGER IF NOT EXISTS update_user_statistics_updated_at BEFORE UPDATE ON user_statistics
+DROP TRIGGER IF EXISTS update_user_statistics_updated_at ON user_statistics;
+CREATE TRIGGER update_user_statistics_updated_at BEFORE UPDATE ON user_statistics
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
-CREATE TRIGGER IF NOT EXISTS update_goals_updated_at BEFORE UPDATE ON goals
+DROP TRIGGER IF EXISTS update_goals_updated_at ON goals;
+CREATE TRIGGER update_goals_updated_at BEFORE UPDATE ON goals
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
 -- Insert default achievements
@@ -228,6 +233,246 @@ BEGIN
 END;
 $ LANGUAGE plpgsql;
 
+-- Keystroke logs are stored deflated with delta-encoded timestamps; the JSONB
+-- column only holds rows written before keystrokes_blob existed
+ALTER TABLE typing_sessions ADD COLUMN IF NOT EXISTS keystrokes_blob BYTEA;
+
+-- Previews are bounded at 100 characters
+ALTER TABLE typing_sessions ALTER COLUMN content_preview TYPE VARCHAR(100) USING LEFT(content_preview, 100);
+
+-- Exponential moving averages so the dashboard reflects recent performance;
+-- NULL until the first session seeds them
+ALTER TABLE user_statistics ADD COLUMN IF NOT EXISTS ema_wpm FLOAT;
+ALTER TABLE user_statistics ADD COLUMN IF NOT EXISTS ema_accuracy FLOAT;
+ALTER TABLE user_statistics ALTER COLUMN ema_wpm DROP DEFAULT;
+ALTER TABLE user_statistics ALTER COLUMN ema_accuracy DROP DEFAULT;
+
+-- Existing users start from their lifetime averages rather than from zero
+UPDATE user_statistics
+SET ema_wpm = average_wpm, ema_accuracy = average_accuracy
+WHERE total_sessions > 0
+  AND (ema_wpm IS NULL OR ema_wpm = 0)
+  AND (ema_accuracy IS NULL OR ema_accuracy = 0);
+
+-- Seed an empty statistics row whenever a user is created
+CREATE OR REPLACE FUNCTION init_user_statistics()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO user_statistics (user_id) VALUES (NEW.id)
+    ON CONFLICT (user_id) DO NOTHING;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS init_user_statistics_on_insert ON users;
+CREATE TRIGGER init_user_statistics_on_insert AFTER INSERT ON users
+    FOR EACH ROW EXECUTE FUNCTION init_user_statistics();
+
+-- Maintain practice streaks as sessions are inserted, under the statistics row lock
+CREATE OR REPLACE FUNCTION update_user_streak()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO user_statistics AS s (user_id, current_streak, longest_streak, last_practice_date)
+    VALUES (NEW.user_id, 1, 1, CURRENT_DATE)
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        current_streak = CASE
+            WHEN s.last_practice_date = CURRENT_DATE THEN GREATEST(s.current_streak, 1)
+            WHEN s.last_practice_date = CURRENT_DATE - 1 THEN s.current_streak + 1
+            ELSE 1
+        END,
+        longest_streak = GREATEST(s.longest_streak, CASE
+            WHEN s.last_practice_date = CURRENT_DATE THEN GREATEST(s.current_streak, 1)
+            WHEN s.last_practice_date = CURRENT_DATE - 1 THEN s.current_streak + 1
+            ELSE 1
+        END),
+        last_practice_date = CURRENT_DATE;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS update_user_streak_on_session ON typing_sessions;
+CREATE TRIGGER update_user_streak_on_session AFTER INSERT ON typing_sessions
+    FOR EACH ROW EXECUTE FUNCTION update_user_streak();
+
+-- Keep the last five sessions per user formatted for the dashboard
+CREATE OR REPLACE FUNCTION update_dashboard_cache()
+RETURNS TRIGGER AS $$
+DECLARE
+    entry JSONB := jsonb_build_object(
+        'date', to_char(NEW.created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD'),
+        'duration', format('%sm %ss', FLOOR(NEW.duration_seconds / 60)::INTEGER, FLOOR(NEW.duration_seconds::NUMERIC % 60)::INTEGER),
+        'wpm', NEW.wpm,
+        'accuracy', NEW.accuracy,
+        'mode', initcap(NEW.content_type)
+    );
+BEGIN
+    INSERT INTO user_dashboard_cache AS c (user_id, recent_sessions)
+    VALUES (NEW.user_id, jsonb_build_array(entry))
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        recent_sessions = (
+            SELECT COALESCE(jsonb_agg(t.e ORDER BY t.i), '[]'::jsonb)
+            FROM jsonb_array_elements(jsonb_build_array(entry) || c.recent_sessions) WITH ORDINALITY AS t(e, i)
+            WHERE t.i <= 5
+        ),
+        updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS update_dashboard_cache_on_session ON typing_sessions;
+CREATE TRIGGER update_dashboard_cache_on_session AFTER INSERT ON typing_sessions
+    FOR EACH ROW EXECUTE FUNCTION update_dashboard_cache();
+
+-- Backfill the dashboard cache from existing sessions
+INSERT INTO user_dashboard_cache (user_id, recent_sessions)
+SELECT user_id, jsonb_agg(jsonb_build_object(
+    'date', to_char(created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD'),
+    'duration', format('%sm %ss', FLOOR(duration_seconds / 60)::INTEGER, FLOOR(duration_seconds::NUMERIC % 60)::INTEGER),
+    'wpm', wpm,
+    'accuracy', accuracy,
+    'mode', initcap(content_type)
+) ORDER BY created_at DESC)
+FROM (
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at DESC) AS rn
+    FROM typing_sessions
+) recent
+WHERE rn <= 5
+GROUP BY user_id
+ON CONFLICT (user_id) DO NOTHING;
+
+-- Fold a finished session into user statistics in a single atomic statement
+CREATE OR REPLACE FUNCTION update_user_stats(
+    p_user_id UUID,
+    p_wpm INTEGER,
+    p_accuracy INTEGER,
+    p_duration FLOAT
+)
+RETURNS SETOF user_statistics AS $$
+    INSERT INTO user_statistics AS s (
+        user_id,
+        total_sessions,
+        total_practice_time_minutes,
+        average_wpm,
+        best_wpm,
+        average_accuracy,
+        best_accuracy,
+        ema_wpm,
+        ema_accuracy
+    ) VALUES (
+        p_user_id,
+        1,
+        GREATEST(1, FLOOR(p_duration / 60))::INTEGER,
+        p_wpm,
+        p_wpm,
+        p_accuracy,
+        p_accuracy,
+        p_wpm,
+        p_accuracy
+    )
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        total_sessions = s.total_sessions + 1,
+        total_practice_time_minutes = s.total_practice_time_minutes + EXCLUDED.total_practice_time_minutes,
+        average_wpm = ROUND(((s.average_wpm * s.total_sessions + p_wpm) / (s.total_sessions + 1))::NUMERIC, 2),
+        average_accuracy = ROUND(((s.average_accuracy * s.total_sessions + p_accuracy) / (s.total_sessions + 1))::NUMERIC, 2),
+        best_wpm = GREATEST(s.best_wpm, p_wpm),
+        best_accuracy = GREATEST(s.best_accuracy, p_accuracy),
+        -- The first session seeds the average; later ones move it by alpha = 0.05
+        ema_wpm = CASE WHEN s.ema_wpm IS NULL THEN p_wpm
+                       ELSE ROUND((s.ema_wpm + 0.05 * (p_wpm - s.ema_wpm))::NUMERIC, 2) END,
+        ema_accuracy = CASE WHEN s.ema_accuracy IS NULL THEN p_accuracy
+                            ELSE ROUND((s.ema_accuracy + 0.05 * (p_accuracy - s.ema_accuracy))::NUMERIC, 2) END
+    -- updated_at is bumped by the update_user_statistics_updated_at trigger
+    RETURNING *;
+$$ LANGUAGE sql;
+
+-- Active achievements a user has not earned yet
+CREATE OR REPLACE FUNCTION unearned_achievements(p_user_id UUID)
+RETURNS TABLE(id VARCHAR, category VARCHAR, criteria JSONB) AS $$
+    SELECT a.id, a.category, a.criteria
+    FROM achievements a
+    WHERE a.is_active = true
+      AND NOT EXISTS (
+          SELECT 1 FROM user_achievements ua
+          WHERE ua.user_id = p_user_id
+          AND ua.achievement_id = a.id
+          AND ua.status = 'earned'
+      );
+$$ LANGUAGE sql STABLE;
+
+-- Award every newly satisfied achievement for a session, announce it on the
+-- 'achievement' channel and return the awarded ids
+-- Callers that already hold post-session statistics pass them in to skip the re-read
+DROP FUNCTION IF EXISTS check_and_award_achievements(UUID, INTEGER, INTEGER);
+CREATE OR REPLACE FUNCTION check_and_award_achievements(
+    p_user_id UUID,
+    p_session_wpm INTEGER,
+    p_session_accuracy INTEGER,
+    p_current_streak INTEGER DEFAULT NULL,
+    p_total_sessions INTEGER DEFAULT NULL
+)
+RETURNS TABLE(achievement_id VARCHAR) AS $$
+#variable_conflict use_column
+DECLARE
+    awarded_ids VARCHAR[];
+BEGIN
+    WITH stats AS (
+        SELECT p_current_streak AS current_streak, p_total_sessions AS total_sessions
+        WHERE p_total_sessions IS NOT NULL
+        UNION ALL
+        SELECT us.current_streak, us.total_sessions
+        FROM user_statistics us
+        WHERE us.user_id = p_user_id
+        AND p_total_sessions IS NULL
+    ),
+    awarded AS (
+        INSERT INTO user_achievements AS ua (
+            user_id,
+            achievement_id,
+            progress_value,
+            progress_percentage,
+            status,
+            earned_at
+        )
+        SELECT p_user_id, a.id, a.target_value, 100, 'earned', NOW()
+        FROM achievements a
+        LEFT JOIN stats s ON true
+        WHERE a.is_active = true
+          AND NOT EXISTS (
+              SELECT 1 FROM user_achievements e
+              WHERE e.user_id = p_user_id
+              AND e.achievement_id = a.id
+              AND e.status = 'earned'
+          )
+          AND (
+              (a.category = 'speed' AND p_session_wpm >= COALESCE((a.criteria->>'min_wpm')::FLOAT, 0))
+              OR (a.category = 'accuracy' AND p_session_accuracy >= COALESCE((a.criteria->>'min_accuracy')::FLOAT, 0))
+              OR (a.category = 'streak' AND COALESCE(s.current_streak, 0) >= COALESCE((a.criteria->>'days')::FLOAT, 0))
+              OR (a.category = 'milestone' AND COALESCE(s.total_sessions, 0) >= COALESCE((a.criteria->>'session_count')::FLOAT, 0))
+          )
+        ON CONFLICT (user_id, achievement_id)
+        DO UPDATE SET
+            progress_value = EXCLUDED.progress_value,
+            progress_percentage = 100,
+            status = 'earned',
+            earned_at = EXCLUDED.earned_at
+        WHERE ua.status <> 'earned'
+        RETURNING ua.achievement_id
+    )
+    SELECT array_agg(awarded.achievement_id) INTO awarded_ids FROM awarded;
+    
+    IF awarded_ids IS NOT NULL THEN
+        PERFORM pg_notify('achievement', json_build_object(
+            'user_id', p_user_id,
+            'achievement_ids', awarded_ids
+        )::text);
+        RETURN QUERY SELECT unnest(awarded_ids);
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Create sample anonymous user (optional)
 DO $
 BEGIN
@@ -247,7 +492,7 @@ CREATE TABLE IF NOT EXISTS typing_sessions (
     user_id UUID REFERENCES users(id) ON DELETE CASCADE,
     session_type VARCHAR(50) DEFAULT 'practice',
     content_type VARCHAR(50) DEFAULT 'custom',
-    content_preview TEXT,
+    content_preview VARCHAR(100),
     wpm INTEGER NOT NULL CHECK (wpm >= 0),
     accuracy INTEGER NOT NULL CHECK (accuracy >= 0 AND accuracy <= 100),
     duration_seconds FLOAT NOT NULL CHECK (duration_seconds > 0),
@@ -255,6 +500,7 @@ CREATE TABLE IF NOT EXISTS typing_sessions (
     errors_count INTEGER DEFAULT 0,
     corrections_count INTEGER DEFAULT 0,
     keystrokes JSONB DEFAULT '[]'::jsonb,
+    keystrokes_blob BYTEA,
     session_data JSONB DEFAULT '{}'::jsonb,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
@@ -269,6 +515,8 @@ CREATE TABLE IF NOT EXISTS user_statistics (
     best_wpm INTEGER DEFAULT 0,
     average_accuracy FLOAT DEFAULT 0,
     best_accuracy INTEGER DEFAULT 0,
+    ema_wpm FLOAT DEFAULT 0,
+    ema_accuracy FLOAT DEFAULT 0,
     current_streak INTEGER DEFAULT 0,
     longest_streak INTEGER DEFAULT 0,
     last_practice_date DATE,
@@ -306,6 +554,13 @@ CREATE TABLE IF NOT EXISTS user_achievements (
     UNIQUE(user_id, achievement_id)
 );
 
+-- Pre-formatted dashboard data, maintained by trigger on typing_sessions
+CREATE TABLE IF NOT EXISTS user_dashboard_cache (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    recent_sessions JSONB DEFAULT '[]'::jsonb,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- Goals table
 CREATE TABLE IF NOT EXISTS goals (
     id UUID DEFAULT uuid_generate_v4() PRIMARY KEY,